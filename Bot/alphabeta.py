@@ -0,0 +1,249 @@
+import time
+
+from Bot.evaluate import Evaluator, popcount
+from Bot.symmetry import symmetries
+
+WIN_SCORE = 1000
+# scores beyond this are wins or losses, WIN_SCORE less the plies to them
+WIN_BOUND = WIN_SCORE // 2
+# territory score in [-1, 1] is scaled to stay well inside +-WIN_SCORE
+EVAL_SCALE = 100
+TT_BITS = 18
+EXACT, LOWER, UPPER = 0, 1, 2
+# how many nodes to visit between two looks at the clock
+CLOCK_INTERVAL = 16
+
+
+class Timeout(Exception):
+    pass
+
+
+class TranspositionTable:
+    """Fixed-size table of search results indexed by the low bits of the
+    Zobrist hash.
+
+    An entry is replaced by results of at least the same depth, or by
+    anything once it is left over from an older search. Win and loss
+    scores count plies from the root, so they are stored counted from the
+    entry's own position and converted back for the ply they are read at.
+    """
+
+    def __init__(self, bits=TT_BITS):
+        self.mask = (1 << bits) - 1
+        self.entries = [None] * (1 << bits)
+        self.generation = 0
+        self.hits = 0
+        self.probes = 0
+
+    def get(self, h, ply=0):
+        self.probes += 1
+        entry = self.entries[h & self.mask]
+        if entry is not None and entry[0] == h:
+            self.hits += 1
+            value = entry[2]
+            if value > WIN_BOUND:
+                return entry[:2] + (value - ply,) + entry[3:]
+            if value < -WIN_BOUND:
+                return entry[:2] + (value + ply,) + entry[3:]
+            return entry
+        return None
+
+    def put(self, h, depth, value, flag, my_move, enemy_move, ply=0):
+        if value > WIN_BOUND:
+            value += ply
+        elif value < -WIN_BOUND:
+            value -= ply
+        slot = h & self.mask
+        old = self.entries[slot]
+        if old is None or old[6] != self.generation or depth >= old[1]:
+            self.entries[slot] = (h, depth, value, flag, my_move, enemy_move, self.generation)
+
+    def new_search(self):
+        self.generation += 1
+
+
+class AlphaBeta:
+    """Iterative-deepening alpha-beta over joint moves.
+
+    Simultaneous moves are searched paranoid: I pick the move with the best
+    worst case over all enemy replies. Leaves are scored with the Voronoi
+    territory evaluation; positions are shared through a Zobrist-hashed
+    transposition table that is kept across turns. Both are keyed on the
+    canonical hash of Bot.symmetry, so mirrored positions are only
+    searched and evaluated once.
+    """
+
+    def __init__(self, grid, tt_bits=TT_BITS):
+        self.grid = grid.copy()
+        self.symmetries = symmetries(grid.rows, grid.cols)
+        self.tt = TranspositionTable(tt_bits)
+        self.evaluator = Evaluator()
+        self.best = None
+        self.value = None
+        self.root_move = None
+        self.depth = 0
+        self.nodes = 0
+        self.deadline = None
+        # set from another thread to end a ponder search early
+        self.stop = None
+
+    def update(self, grid, moves=None):
+        self.grid = grid.copy()
+        self.best = None
+        self.value = None
+
+    def _moves(self, cell, first):
+        # free moves with the most open target cells first, TT move in front;
+        # a trapped rider still has to move somewhere, and crashes
+        grid = self.grid
+        free = grid.free_cells()
+        tables = grid.tables
+        moves = grid.valid_action_indices(cell)
+        if not moves:
+            return [0]
+        moves.sort(key=lambda a: -popcount(tables.neighbours[tables.steps[cell][a]] & free))
+        if first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def _terminal(self, ply):
+        # prefer quick wins and late losses
+        grid = self.grid
+        i_lost = grid.i_lost()
+        enemy_lost = grid.enemy_lost()
+        if i_lost and enemy_lost:
+            return 0
+        if i_lost:
+            return -WIN_SCORE + ply
+        return WIN_SCORE - ply
+
+    def _search(self, depth, ply, alpha, beta, wall_hashes):
+        grid = self.grid
+        sym = self.symmetries
+        self.nodes += 1
+        if self.nodes % CLOCK_INTERVAL == 0 and (time.monotonic() > self.deadline or
+                                                 (self.stop is not None and self.stop.is_set())):
+            raise Timeout()
+        if grid.game_over():
+            return self._terminal(ply)
+        if depth == 0:
+            key, _, swapped = sym.canonical(wall_hashes, grid.my_cell, grid.enemy_cell, swap=True)
+            return EVAL_SCALE * self.evaluator.symmetric_score(grid, key, swapped)
+
+        # TT moves are stored in the canonical frame
+        h, t, _ = sym.canonical(wall_hashes, grid.my_cell, grid.enemy_cell)
+        entry = self.tt.get(h, ply)
+        tt_my = tt_enemy = None
+        if entry is not None:
+            tt_my, tt_enemy = sym.inverse_actions[t][entry[4]], sym.inverse_actions[t][entry[5]]
+            if ply > 0 and entry[1] >= depth:
+                value, flag = entry[2], entry[3]
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    return value
+
+        alpha_orig = alpha
+        my_cell = grid.my_cell
+        enemy_cell = grid.enemy_cell
+        child_hashes = sym.child_wall_hashes(wall_hashes, my_cell, enemy_cell)
+        my_moves = self._moves(my_cell, tt_my)
+        enemy_moves = self._moves(enemy_cell, tt_enemy)
+        best = -WIN_SCORE - 1
+        best_my = my_moves[0]
+        best_enemy = enemy_moves[0]
+        for m in my_moves:
+            # min node: the enemy picks the reply that is worst for me
+            worst = WIN_SCORE + 1
+            worst_enemy = enemy_moves[0]
+            b = beta
+            for e in enemy_moves:
+                grid.apply_action(m, e)
+                try:
+                    if grid.game_over():
+                        v = self._terminal(ply + 1)
+                    else:
+                        v = self._search(depth - 1, ply + 1, alpha, b, child_hashes)
+                finally:
+                    grid.undo_move()
+                if v < worst:
+                    worst, worst_enemy = v, e
+                    if worst <= alpha:
+                        break
+                    b = min(b, worst)
+            if worst > best:
+                best, best_my, best_enemy = worst, m, worst_enemy
+                if best >= beta:
+                    break
+                alpha = max(alpha, best)
+
+        flag = EXACT
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        self.tt.put(h, depth, best, flag, sym.actions[t][best_my], sym.actions[t][best_enemy], ply)
+        if ply == 0:
+            self.root_move = best_my
+        return best
+
+    def search(self, deadline):
+        grid = self.grid
+        if grid.game_over():
+            return
+        self.deadline = deadline
+        self.tt.new_search()
+        wall_hashes = self.symmetries.wall_hashes(grid.walls)
+        free = popcount(grid.free_cells())
+        # iterative deepening: every finished depth leaves its best move in
+        # the TT, which orders the next, deeper iteration
+        for depth in range(1, free // 2 + 2):
+            try:
+                value = self._search(depth, 0, -WIN_SCORE - 1, WIN_SCORE + 1, wall_hashes)
+            except Timeout:
+                break
+            self.depth = depth
+            self.best = self.root_move
+            self.value = value
+            if abs(value) >= WIN_SCORE - depth:
+                # the result is proven, deeper search cannot change it
+                break
+
+    def ponder(self, action, deadline, stop):
+        """Deepen every enemy reply to my chosen action in turn until stopped.
+        The results stay in the transposition table, where the search of the
+        real next position finds those of the branch that was played."""
+        grid = self.grid
+        if grid.game_over():
+            return
+        self.deadline = deadline
+        self.stop = stop
+        self.tt.new_search()
+        replies = self._moves(grid.enemy_cell, None)
+        try:
+            for depth in range(1, popcount(grid.free_cells()) // 2 + 1):
+                for e in replies:
+                    grid.apply_action(action, e)
+                    try:
+                        if not grid.game_over():
+                            wall_hashes = self.symmetries.wall_hashes(grid.walls)
+                            self._search(depth, 0, -WIN_SCORE - 1, WIN_SCORE + 1, wall_hashes)
+                    finally:
+                        grid.undo_move()
+        except Timeout:
+            pass
+        finally:
+            self.stop = None
+            self.root_move = None
+
+    def best_action(self):
+        if self.best is None:
+            moves = self.grid.valid_action_indices(self.grid.my_cell)
+            return moves[0] if moves else 0
+        return self.best
+
+    def stats(self):
+        return {'nodes': self.nodes, 'depth': self.depth, 'value': self.value, 'tt_hits': self.tt.hits,
+                'tt_probes': self.tt.probes, 'eval_hits': self.evaluator.hits, 'eval_misses': self.evaluator.misses}
+
+    def save(self):
+        pass
@@ -0,0 +1,171 @@
+"""Opening book for the mirrored start positions.
+
+Games start from a small family of positions: player 0 at a row in
+1..rows-2 and a column in 1..cols//2-2, player 1 mirrored across the
+centre (see gym_lightriders.layouts.start_positions). The book holds a
+deep AlphaBeta search of every position the first `plies` moves can lead
+to when I follow the book and the enemy plays anything, keyed on the
+canonical Zobrist hash of Bot.symmetry, so both sides and all mirror
+images of a position share one entry. A hit is played without searching.
+
+    python -m Bot.book --plies 3 --seconds 3 --output Bot/book.bin
+
+The file is a HEADER (magic, board size, depth it was built to, number of
+entries) followed by the sorted 64-bit hashes and one byte per entry with
+the joint move in the canonical frame, my action in the low two bits.
+"""
+import os
+import struct
+import sys
+import time
+from array import array
+
+from Bot.evaluate import popcount
+from Bot.grid import LRGrid
+from Bot.symmetry import symmetries
+
+PLIES = 3
+SEARCH_SECONDS = 3.0
+MAGIC = b'RLOB'
+HEADER = struct.Struct('<4sHHHI')
+
+
+def start_cells(rows, cols):
+    """(my cell, enemy cell) of every legal start with me on the left."""
+    return [(row * cols + col, row * cols + cols - 1 - col)
+            for row in range(1, rows - 1) for col in range(1, cols // 2 - 1)]
+
+
+class OpeningBook:
+
+    def __init__(self, rows, cols, plies, moves):
+        self.rows = rows
+        self.cols = cols
+        self.plies = plies
+        # canonical hash -> (my action, enemy action) in the canonical frame
+        self.moves = moves
+        self.symmetries = symmetries(rows, cols)
+        self.hits = 0
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, rows, cols, plies, n = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('%s is not an opening book' % path)
+        keys = array('Q')
+        keys.frombytes(data[HEADER.size:HEADER.size + 8 * n])
+        if sys.byteorder != 'little':
+            keys.byteswap()
+        packed = data[HEADER.size + 8 * n:HEADER.size + 9 * n]
+        moves = {key: (move & 3, move >> 2) for key, move in zip(keys, packed)}
+        return cls(rows, cols, plies, moves)
+
+    def save(self, path):
+        keys = array('Q', sorted(self.moves))
+        packed = bytes(self.moves[key][0] | self.moves[key][1] << 2 for key in keys)
+        if sys.byteorder != 'little':
+            keys.byteswap()
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.rows, self.cols, self.plies, len(packed)))
+            f.write(keys.tobytes())
+            f.write(packed)
+
+    def lookup(self, grid):
+        """Book move for grid, or None when it is not in the book."""
+        if (grid.rows, grid.cols) != (self.rows, self.cols) or grid.game_over():
+            return None
+        # every move walls off two cells, so later positions cannot be in it
+        if popcount(grid.walls) > 2 * self.plies:
+            return None
+        key, t, _ = self.symmetries.canonical_key(grid)
+        move = self.moves.get(key)
+        if move is None:
+            return None
+        action = self.symmetries.inverse_actions[t][move[0]]
+        if action not in grid.valid_action_indices(grid.my_cell):
+            return None
+        self.hits += 1
+        return action
+
+
+_ENGINES = {}
+
+
+def _search(job):
+    # one AlphaBeta per worker and board size, so the TT is shared between
+    # the positions a worker gets
+    walls, my_cell, enemy_cell, rows, cols, seconds = job
+    from Bot.alphabeta import AlphaBeta
+    grid = LRGrid.from_bits(walls, my_cell, enemy_cell, rows, cols)
+    engine = _ENGINES.get((rows, cols))
+    if engine is None:
+        engine = _ENGINES[(rows, cols)] = AlphaBeta(grid)
+    engine.update(grid)
+    engine.search(time.monotonic() + seconds)
+    my_action = engine.best_action()
+    # the enemy reply the search expects, read back from the TT, where it
+    # already is in the canonical frame
+    sym = engine.symmetries
+    key, t, _ = sym.canonical_key(grid)
+    entry = engine.tt.get(key)
+    enemy_action = entry[5] if entry is not None else 0
+    return key, sym.actions[t][my_action], enemy_action
+
+
+def build(rows, cols, plies=PLIES, seconds=SEARCH_SECONDS, workers=None, log=None):
+    """Search every start and every position reachable from it in fewer
+    than plies moves with me playing book moves, one ply at a time."""
+    import multiprocessing
+    sym = symmetries(rows, cols)
+    moves = {}
+    frontier = {}
+    for my_cell, enemy_cell in start_cells(rows, cols):
+        grid = LRGrid.from_bits(0, my_cell, enemy_cell, rows, cols)
+        frontier.setdefault(sym.canonical_key(grid)[0], grid)
+    with multiprocessing.Pool(workers or multiprocessing.cpu_count()) as pool:
+        for ply in range(plies):
+            jobs = [(g.walls, g.my_cell, g.enemy_cell, rows, cols, seconds) for g in frontier.values()]
+            start = time.monotonic()
+            results = pool.map(_search, jobs, chunksize=1)
+            if log is not None:
+                log('ply %d: %d positions in %.1fs' % (ply, len(jobs), time.monotonic() - start))
+            grids = list(frontier.values())
+            frontier = {}
+            for grid, (key, my_move, enemy_move) in zip(grids, results):
+                moves[key] = (my_move, enemy_move)
+                if ply + 1 == plies:
+                    continue
+                _, t, _ = sym.canonical_key(grid)
+                action = sym.inverse_actions[t][my_move]
+                for enemy_action in grid.valid_action_indices(grid.enemy_cell):
+                    child = grid.copy()
+                    child.apply_action(action, enemy_action)
+                    if not child.game_over():
+                        frontier.setdefault(sym.canonical_key(child)[0], child)
+    return OpeningBook(rows, cols, plies, moves)
+
+
+def main():
+    # the bot only loads books, the builder's imports stay out of its start-up
+    import argparse
+    import multiprocessing
+    parser = argparse.ArgumentParser(description='Build the LightRiders opening book')
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--cols', type=int, default=16)
+    parser.add_argument('--plies', type=int, default=PLIES, help='moves of mine covered from the start')
+    parser.add_argument('--seconds', type=float, default=SEARCH_SECONDS, help='search time per position')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin'))
+    args = parser.parse_args()
+
+    book = build(args.rows, args.cols, args.plies, args.seconds, args.workers, log=print)
+    book.save(args.output)
+    print('%d positions written to %s' % (len(book.moves), args.output))
+
+
+if __name__ == '__main__':
+    main()
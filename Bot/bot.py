@@ -1,9 +1,41 @@
-from Bot.grid import LRGrid
-import numpy as np
+# engines are imported when they are made, so the bot process starts
+# without numpy unless its strategy needs it
+from Bot.grid import LRGrid, ACTIONS, LOSS_REWARD, unpack_bits
+from Bot.book import OpeningBook
+from Bot.endgame import Endgame
+import os
+import random
 import sys
+import threading
+import time
 
 GAMMA = 0.9
-ALL_POSSIBLE_ACTIONS = ('up', 'down', 'left', 'right')
+ALL_POSSIBLE_ACTIONS = ACTIONS
+ACTION_IDS = tuple(range(len(ACTIONS)))
+ALPHA = 0.1
+# share of the remaining timebank one move may use, and a margin (ms)
+# kept back for the engine round trip
+TIME_FRACTION = 0.1
+SAFETY_MARGIN_MS = 20
+# return of running into a wall, the crash ends the episode
+CRASH_VALUE = LOSS_REWARD
+# optional .npy file the Q-table is warm-started from and saved back to
+QTABLE_PATH = os.environ.get('RLLR_QTABLE')
+# decision engine: 'qlearning', 'mcts', 'alphabeta' or 'network', and the
+# playout policy of mcts
+STRATEGY = os.environ.get('RLLR_STRATEGY', 'qlearning')
+MCTS_PLAYOUT = os.environ.get('RLLR_PLAYOUT', 'random')
+# directory of a Bot.network model; mcts then values leaves with it
+MODEL_PATH = os.environ.get('RLLR_MODEL')
+# opening book of Bot.book played without searching; empty to turn it off
+BOOK_PATH = os.environ.get('RLLR_BOOK', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin'))
+# episodes QLearning plays together with Bot.lockstep, 0 for one at a time
+ROLLOUTS = int(os.environ.get('RLLR_ROLLOUTS', '128'))
+# where Bot.telemetry writes a record per turn: '-' for stderr or a file
+TELEMETRY = os.environ.get('RLLR_TELEMETRY')
+# keep searching while the opponent thinks, for at most PONDER_SECONDS
+PONDER = os.environ.get('RLLR_PONDER', '0') == '1'
+PONDER_SECONDS = 5.0
 
 
 def max_dict(d):
@@ -18,10 +50,10 @@ def max_dict(d):
     return max_key, max_val
 
 
-def random_action(a, eps=0.5):
+def random_action(a, eps=0.5, actions=ALL_POSSIBLE_ACTIONS):
     # choose given a with probability 1 - eps + eps/4
     # choose some other a' != a with probability eps/4
-    p = np.random.random()
+    p = random.random()
     # if p < (1 - eps + eps/len(ALL_POSSIBLE_ACTIONS)):
     #   return a
     # else:
@@ -33,7 +65,7 @@ def random_action(a, eps=0.5):
     if p < (1 - eps):
         return a
     else:
-        return np.random.choice(ALL_POSSIBLE_ACTIONS)
+        return actions[random.randrange(len(actions))]
 
 
 def play_game(grid, policy):
@@ -51,10 +83,12 @@ def play_game(grid, policy):
         r, grid = grid.move(a)
         s = grid.current_state()
         if grid.game_over():
-            if grid.i_lost():
-                r -= 100
-            if grid.enemy_lost():
-                r += 100
+            # a crash is already scored by move, only getting trapped is not
+            if not (grid.my_dead or grid.enemy_dead):
+                if grid.i_lost():
+                    r -= 100
+                if grid.enemy_lost():
+                    r += 100
             states_actions_rewards.append((s, None, r))
             break
         else:
@@ -78,92 +112,273 @@ def play_game(grid, policy):
     return states_actions_returns
 
 
-class Bot:
+class QLearning:
+    """Tabular Q-learning against the random opponent of LRGrid."""
 
-    def __init__(self, game):
-        # self.game = game
-        grid = LRGrid(game.field_data, game.field_height, game.field_width, str(game.my_botid),
-                      str(game.other_botid))
-        # initialize Q(s,a)
-        Q = {}
-        states = grid.all_states()
-        for s in states:
-            Q[s] = {}
-            for a in ALL_POSSIBLE_ACTIONS:
-                Q[s][a] = 0
-
-        # let's also keep track of how many times Q[s] has been updated
-        update_counts = {}
-        update_counts_sa = {}
-        for s in states:
-            update_counts_sa[s] = {}
-            for a in ALL_POSSIBLE_ACTIONS:
-                update_counts_sa[s][a] = 1.0
-        # repeat until convergence
-        ALPHA = 0.1
-        t = 1.0
-        deltas = []
-        for it in range(np.min([game.round, 25])):
-            my_grid = grid
-            if it % 3 == 0:
-                t += 1
-            # if it % 2000 == 0:
-            # print("it:", it)
-
-            # instead of 'generating' an epsiode, we will PLAY
-            # an episode within this loop
-            s = my_grid.current_state()  # start state
-
-            # the first (s, r) tuple is the state we start in and 0
-            # (since we don't get a reward) for simply starting the game
-            # the last (s, r) tuple is the terminal state and the final reward
-            # the value for the terminal state is by definition 0, so we don't
-            # care about updating it.
-            a, _ = max_dict(Q[s])
-            biggest_change = 0
-            while not my_grid.game_over():
-                a = random_action(a, eps=0.5 / t)  # epsilon-greedy
-                # random action also works, but slower since you can bump into walls
-                # a = np.random.choice(ALL_POSSIBLE_ACTIONS)
-                r, my_grid = my_grid.move(a)
-                if my_grid.i_lost():
+    def __init__(self, grid, qtable_path=QTABLE_PATH, replay=None, rollouts=ROLLOUTS):
+        self.grid = grid
+        self.qtable_path = qtable_path
+        # optional gym_lightriders.replay.ReplayBuffer every step is stored in
+        self.replay = replay
+        # episodes played in lock-step per batch; the replay buffer needs
+        # every step as a grid, so it gets them one at a time
+        self.rollouts = rollouts if replay is None else 0
+        self.lockstep = None
+        if self.rollouts:
+            import numpy as np
+            from Bot.lockstep import LockstepRollouts
+            self.lockstep = LockstepRollouts(grid.rows, grid.cols)
+            # seeded from random, so random.seed makes the batches repeatable
+            self.rng = np.random.default_rng(random.getrandbits(64))
+        from Bot.qtable import QTable
+        # initialize Q(s,a), warm-started from disk when a table is configured
+        self.q = None
+        if qtable_path:
+            self.q = QTable.load(qtable_path, ALPHA, GAMMA)
+            if self.q is not None and (self.q.rows, self.q.cols) != (grid.rows, grid.cols):
+                self.q = None
+        if self.q is None:
+            self.q = QTable(grid.rows, grid.cols, ALPHA, GAMMA)
+        self.q.mark_blocked(unpack_bits(grid.walls, grid.rows * grid.cols), CRASH_VALUE)
+        self.t = 1.0
+        self.episodes = 0
+        self.steps = 0
+        self.deltas = []
+
+    def update(self, grid, moves=None):
+        # a new field arrived: keep Q and only fix up the cells that got walled
+        new_walls = grid.walls & ~self.grid.walls
+        self.grid = grid
+        if new_walls:
+            self.q.mark_blocked(unpack_bits(new_walls, grid.rows * grid.cols), CRASH_VALUE)
+
+    def save(self):
+        if self.qtable_path:
+            self.q.save(self.qtable_path)
+
+    def play_episode(self):
+        grid = self.grid
+        # Q only changes at the end of the episode, so the greedy policy can
+        # be extracted once up front as a flat per-cell list
+        policy = self.q.policy().reshape(-1).tolist()
+        if self.episodes % 3 == 0:
+            self.t += 1
+        self.episodes += 1
+
+        # instead of 'generating' an epsiode, we will PLAY
+        # an episode within this loop, in place on the root grid
+        cells, actions, rewards, next_cells, dones = [], [], [], [], []
+        s = grid.my_cell  # start state
+        a = policy[s]
+        done = grid.game_over()
+        while not done:
+            a = random_action(a, eps=0.5 / self.t, actions=ACTION_IDS)  # epsilon-greedy
+            before = grid.copy() if self.replay is not None else None
+            r = grid.apply_action(a)
+            i_lost = grid.i_lost()
+            enemy_lost = grid.enemy_lost()
+            # a crash is already scored by apply_action, only getting
+            # trapped is not
+            if not (grid.my_dead or grid.enemy_dead):
+                if i_lost:
                     r -= 100
-                if my_grid.enemy_lost():
+                if enemy_lost:
                     r += 100
-                s2 = my_grid.current_state()
+            done = i_lost or enemy_lost
+            s2 = grid.my_cell
+            cells.append(s)
+            actions.append(a)
+            rewards.append(r)
+            next_cells.append(s2)
+            dones.append(done)
+            if before is not None:
+                enemy_a = before.tables.action_to(before.enemy_cell, grid.enemy_cell)
+                self.replay.add_grid(before, (a, -1 if enemy_a is None else enemy_a), r, grid, done)
+
+            # next state becomes current state
+            s = s2
+            a = policy[s2]
 
-                # adaptive learning rate
-                alpha = ALPHA / update_counts_sa[s][a]
-                update_counts_sa[s][a] += 0.005
+        self.steps += len(cells)
+        for _ in range(len(cells)):
+            grid.undo_move()
+        # no cell is visited twice in one episode, so the TD updates of the
+        # whole episode can be applied at once
+        self.deltas.append(self.q.update(cells, actions, rewards, next_cells, dones))
 
-                # we will update Q(s,a) AS we experience the episode
-                old_qsa = Q[s][a]
-                # the difference between SARSA and Q-Learning is with Q-Learning
-                # we will use this max[a']{ Q(s',a')} in our update
-                # even if we do not end up taking this action in the next step
-                a2, max_q_s2a2 = max_dict(Q[s2])
-                Q[s][a] = Q[s][a] + alpha * (r + GAMMA * max_q_s2a2 - Q[s][a])
-                biggest_change = max(biggest_change, np.abs(old_qsa - Q[s][a]))
+    def play_batch(self):
+        """self.rollouts episodes at once, with the exploration schedule
+        they would have had one after another, and one bulk TD update."""
+        import numpy as np
+        k = self.rollouts
+        episodes = self.episodes + np.arange(k)
+        # play_episode raises t before every third episode
+        t = self.t + episodes // 3 - (self.episodes - 1) // 3
+        self.t = float(t[-1])
+        self.episodes += k
+        policy = self.q.policy().reshape(-1)
+        cells, actions, rewards, next_cells, dones = self.lockstep.play(self.grid, k, policy, 0.5 / t, self.rng,
+                                                                        self.grid.opponent)
+        self.steps += len(cells)
+        self.deltas.append(self.q.update(cells, actions, rewards, next_cells, dones, average=True))
 
-                # we would like to know how often Q(s) has been updated too
-                update_counts[s] = update_counts.get(s, 0) + 1
+    def play(self):
+        if self.lockstep is not None:
+            self.play_batch()
+        else:
+            self.play_episode()
 
-                # next state becomes current state
-                s = s2
-                a = a2
+    def search(self, deadline):
+        # anytime search: keep refining Q until the deadline, but always
+        # play at least one batch so there is an estimate to act on; the
+        # next one only starts if one as long as the last still fits
+        start = time.monotonic()
+        self.play()
+        now = time.monotonic()
+        while now + (now - start) < deadline:
+            start = now
+            self.play()
+            now = time.monotonic()
 
-            deltas.append(biggest_change)
+    def ponder(self, action, deadline, stop):
+        # learn from the cell my move leads to, whatever the enemy does
+        grid = self.grid
+        if grid.game_over():
+            return
+        grid.apply_action(action)
+        try:
+            while not stop.is_set() and time.monotonic() < deadline and not grid.game_over():
+                self.play()
+        finally:
+            grid.undo_move()
 
+    def best_action(self):
         # determine the policy from Q*
-        # find V* from Q*
-        policy = {}
-        V = {}
-        for s in grid.actions.keys():
-            a, max_q = max_dict(Q[s])
-            policy[s] = a
-            V[s] = max_q
+        x, y = self.grid.current_state()
+        return self.q.policy()[x, y]
+
+    def stats(self):
+        x, y = self.grid.current_state()
+        return {'episodes': self.episodes, 'steps': self.steps, 'value': float(self.q.best(x, y)[1])}
+
+
+def make_engine(strategy, grid):
+    if strategy == 'qlearning':
+        return QLearning(grid)
+    if strategy == 'mcts':
+        from Bot.mcts import MCTS
+        net = None
+        if MODEL_PATH:
+            from Bot.network import PolicyValueNet
+            net = PolicyValueNet.load(MODEL_PATH)
+        return MCTS(grid, MCTS_PLAYOUT, net)
+    if strategy == 'network':
+        if not MODEL_PATH:
+            raise ValueError('the network strategy needs RLLR_MODEL')
+        from Bot.network import NetworkPolicy, PolicyValueNet
+        return NetworkPolicy(grid, PolicyValueNet.load(MODEL_PATH))
+    if strategy == 'alphabeta':
+        from Bot.alphabeta import AlphaBeta
+        return AlphaBeta(grid)
+    raise ValueError('unknown strategy %r' % strategy)
 
-        self.next_move = policy[grid.current_state()]
+
+class Bot:
+
+    def __init__(self, game, time_fraction=TIME_FRACTION, strategy=STRATEGY, ponder=PONDER, book_path=BOOK_PATH,
+                 telemetry=TELEMETRY):
+        self.game = game
+        self.time_fraction = time_fraction
+        self.grid = self.read_grid(game)
+        self.strategy = strategy
+        self.engine = make_engine(strategy, self.grid)
+        self.book = OpeningBook.load(book_path)
+        self.telemetry = None
+        if telemetry:
+            from Bot.telemetry import Telemetry
+            self.telemetry = Telemetry(telemetry)
+        # where the last move came from: 'engine', 'book' or 'endgame', and
+        # the endgame solver's (path length, proven) for it
+        self.source = None
+        self.endgame_result = None
+        # once the riders are separated the endgame solver takes over
+        self.endgame = Endgame()
+        self.ponder = ponder
+        self.last_action = None
+        self.separated = False
+        self.ponder_thread = None
+        self.ponder_stop = threading.Event()
+
+    @staticmethod
+    def read_grid(game):
+        # Game decodes every field as it arrives
+        if game.grid is not None:
+            return game.grid
+        return LRGrid(game.field_data, game.field_height, game.field_width, str(game.my_botid),
+                      str(game.other_botid))
+
+    def update(self, game):
+        self.game = game
+        self.grid = self.read_grid(game)
+        # engines re-root on the joint move the game saw being played
+        self.engine.update(self.grid, game.last_moves)
+
+    def save(self):
+        self.engine.save()
+
+    def deadline(self):
+        # spend a fixed share of whatever is left in the timebank on this move
+        budget = max(0, self.game.time_remaining() * self.time_fraction - SAFETY_MARGIN_MS)
+        return time.monotonic() + budget / 1000.0
 
     def do_turn(self):
-        return self.next_move
+        if self.telemetry is not None:
+            return self.telemetry.turn(self, self._decide)
+        return self._decide()
+
+    def _decide(self):
+        deadline = self.deadline()
+        self.separated = self.endgame.separated(self.grid)
+        if self.separated:
+            self.source = 'endgame'
+            action, length, proven = self.endgame.solve(self.grid, deadline)
+            self.endgame_result = (length, proven)
+        else:
+            # openings in the book are played at once, saving the timebank
+            self.source = 'book'
+            action = None if self.book is None else self.book.lookup(self.grid)
+            if action is None:
+                self.source = 'engine'
+                self.engine.search(deadline)
+                action = self.engine.best_action()
+        self.last_action = action
+        return ACTIONS[action]
+
+    def start_pondering(self):
+        """Search the positions my last move can lead to in a background
+        thread, until stop_pondering is called or PONDER_SECONDS pass."""
+        if not self.ponder or self.last_action is None or self.ponder_thread is not None:
+            return
+        self.ponder_stop.clear()
+        self.ponder_thread = threading.Thread(target=self._ponder, args=(self.last_action,), daemon=True)
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        # engines look at the stop flag every few hundred nodes at most
+        if self.ponder_thread is None:
+            return
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+
+    def _ponder(self, action):
+        deadline = time.monotonic() + PONDER_SECONDS
+        try:
+            if self.separated:
+                self.endgame.ponder(self.grid, action, deadline, self.ponder_stop)
+            else:
+                self.engine.ponder(action, deadline, self.ponder_stop)
+        except Exception:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.flush()
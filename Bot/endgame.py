@@ -0,0 +1,136 @@
+"""Endgame solver for separated riders.
+
+Once the riders cannot reach each other any more, whoever survives longer
+wins, so each rider just wants the longest path through its own region.
+The solver is an exact depth-first search memoized on (cell, free cells)
+that stops as soon as a path meets its upper bound.
+"""
+import time
+
+from Bot.evaluate import evaluate, flood, popcount
+
+MAX_ENTRIES = 500000
+CLOCK_INTERVAL = 128
+# deepest path searched exactly, well inside Python's recursion limit;
+# larger regions (big boards) are left to the wall-hugging fallback
+MAX_DEPTH = 400
+
+
+class Timeout(Exception):
+    pass
+
+
+def upper_bound(tables, cell, free):
+    """Longest path from cell through free can visit at most every cell of
+    its region, and has to alternate checkerboard colours."""
+    region = flood(tables, 1 << cell, free)
+    if (1 << cell) & tables.even_cells:
+        same, other = popcount(region & tables.even_cells), popcount(region & ~tables.even_cells)
+    else:
+        same, other = popcount(region & ~tables.even_cells), popcount(region & tables.even_cells)
+    # the first step goes to the other colour
+    return min(popcount(region), 2 * min(same, other) + (1 if other > same else 0))
+
+
+class Endgame:
+    """Longest-path solver; the memo is kept across turns, since the
+    position after my move is exactly one of the subproblems already solved."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.memo = {}
+        self.hint = None
+        self.nodes = 0
+        self.deadline = None
+        # set from another thread to end a ponder search early
+        self.stop = None
+
+    def separated(self, grid):
+        # walls only grow, so the last separated evaluation stays valid as hint
+        self.hint = evaluate(grid, self.hint)
+        if not self.hint.separated:
+            self.hint = None
+            return False
+        return True
+
+    def _ordered(self, tables, cell, free):
+        # hug the walls: cells with fewer free neighbours first
+        targets = [t for t in tables.steps[cell] if t >= 0 and (free >> t) & 1]
+        targets.sort(key=lambda t: popcount(tables.neighbours[t] & free))
+        return targets
+
+    def _longest(self, tables, cell, free, depth):
+        key = (cell, free)
+        value = self.memo.get(key)
+        if value is not None:
+            return value
+        self.nodes += 1
+        if self.nodes % CLOCK_INTERVAL == 0 and (time.monotonic() > self.deadline or
+                                                 (self.stop is not None and self.stop.is_set())):
+            raise Timeout()
+        if depth > MAX_DEPTH:
+            raise Timeout()
+        bound = upper_bound(tables, cell, free)
+        best = 0
+        for t in self._ordered(tables, cell, free):
+            if best >= bound:
+                break
+            best = max(best, 1 + self._longest(tables, t, free & ~(1 << t), depth + 1))
+        if len(self.memo) >= self.max_entries:
+            self.memo.clear()
+        self.memo[key] = best
+        return best
+
+    def solve(self, grid, deadline):
+        """Returns (action index, path length, proven) for my rider.
+
+        Without a proof before the deadline, the move leading to the longest
+        path found so far is returned.
+        """
+        tables = grid.tables
+        self.deadline = deadline
+        cell = grid.my_cell
+        free = self.hint.my_region if self.hint is not None else grid.free_cells()
+        bound = upper_bound(tables, cell, free)
+        best, best_target = -1, None
+        proven = True
+        try:
+            for t in self._ordered(tables, cell, free):
+                if best >= bound:
+                    break
+                length = 1 + self._longest(tables, t, free & ~(1 << t), 1)
+                if length > best:
+                    best, best_target = length, t
+        except Timeout:
+            proven = False
+        if best_target is None:
+            # trapped, or out of time before the first answer
+            targets = self._ordered(tables, cell, free)
+            if not targets:
+                return 0, 0, True
+            return tables.action_to(cell, targets[0]), 1, False
+        return tables.action_to(cell, best_target), best, proven
+
+    def stats(self):
+        return {'nodes': self.nodes, 'memo_entries': len(self.memo)}
+
+    def ponder(self, grid, action, deadline, stop):
+        """Solve the position after my chosen move into the memo; the enemy
+        cannot reach my region any more, so its reply does not matter."""
+        if self.hint is None:
+            return
+        tables = grid.tables
+        target = tables.steps[grid.my_cell][action]
+        free = self.hint.my_region
+        if target < 0 or not (free >> target) & 1:
+            return
+        # the region as the next turn's evaluate will see it
+        free = flood(tables, 1 << target, free & ~(1 << target))
+        self.deadline = deadline
+        self.stop = stop
+        try:
+            self._longest(tables, target, free, 1)
+        except Timeout:
+            pass
+        finally:
+            self.stop = None
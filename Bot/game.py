@@ -2,10 +2,10 @@
 # Ported from the hackman python2 starter package 
 
 import sys
-import traceback
 import time
 
 from Bot.bot import Bot
+from Bot.grid import LRGrid
 from . import player
 
 
@@ -21,54 +21,109 @@ class Game():
         self.field_height = 0
 
         self.field_data = ""
+        # current board and the (my, enemy) action indices just played,
+        # None when they cannot be read off the previous board
+        self.grid = None
+        self.last_moves = None
         self.round = 0
         self.last_update = 0
         self.last_timebank = 0
+        # seconds spent reading and decoding input since the last decision
+        self.parse_seconds = 0.0
         self.players = [player.Player(), player.Player()]
+        self.commands = {
+            "settings": self.parse_settings,
+            "update": self.parse_update,
+            "action": self.parse_action,
+            "quit": self.parse_quit,
+        }
+        self.settings = {
+            "timebank": self.set_timebank,
+            "time_per_move": self.set_time_per_move,
+            "player_names": self.set_player_names,
+            "your_bot": self.set_your_bot,
+            "your_botid": self.set_your_botid,
+            "field_width": self.set_field_width,
+            "field_height": self.set_field_height,
+        }
 
     def update(self, data):
-        'parse input'
-        # start timer
-        self.last_update = time.time()
+        'parse a block of input lines'
         for line in data.split('\n'):
-            line = line.strip()
-            if len(line) > 0:
-                tokens = line.split()
-                key0 = tokens[0]
-                if key0 == "settings":
-                    key1 = tokens[1]
-                    if key1 == "timebank":
-                        self.timebank = int(tokens[2])
-                    if key1 == "time_per_move":
-                        self.time_per_move = int(tokens[2])
-                    if key1 == "player_names":
-                        self.player_names = tokens[2].split(',')
-                    if key1 == "your_bot":
-                        self.my_bot = tokens[2]
-                    if key1 == "your_botid":
-                        self.my_botid = int(tokens[2])
-                        self.other_botid = 1 - self.my_botid
-                    if key1 == "field_width":
-                        self.field_width = int(tokens[2])
-                    if key1 == "field_height":
-                        self.field_height = int(tokens[2])
-                elif key0 == "update":
-                    key1 = tokens[1]
-                    if key1 == "game":
-                        key2 = tokens[2]
-                        if key2 == "round":
-                            self.round = int(tokens[3])
-                        elif key2 == "field":
-                            self.field_data = tokens[3]
-                elif key0 == "action" and tokens[1] == "move":
-                    self.last_timebank = int(tokens[2])
-                    # Launching bot logic happens after setup finishes
-                elif key0 == "quit":
-                    pass
+            self.parse_line(line)
 
+    def parse_line(self, line):
+        """Parse one line of input and return its command ('settings',
+        'update', 'action', 'quit'), or None for blank or unknown lines."""
+        tokens = line.split()
+        if not tokens:
+            return None
+        handler = self.commands.get(tokens[0])
+        if handler is None:
+            return None
+        handler(tokens)
+        return tokens[0]
+
+    def parse_settings(self, tokens):
+        handler = self.settings.get(tokens[1])
+        if handler is not None:
+            handler(tokens[2])
+
+    def set_timebank(self, value):
+        self.initial_timebank = int(value)
+        self.last_timebank = self.initial_timebank
+
+    def set_time_per_move(self, value):
+        self.time_per_move = int(value)
+
+    def set_player_names(self, value):
+        self.player_names = value.split(',')
+
+    def set_your_bot(self, value):
+        self.my_bot = value
+
+    def set_your_botid(self, value):
+        self.my_botid = int(value)
+        self.other_botid = 1 - self.my_botid
+
+    def set_field_width(self, value):
+        self.field_width = int(value)
+
+    def set_field_height(self, value):
+        self.field_height = int(value)
+
+    def parse_update(self, tokens):
+        if tokens[1] != "game":
+            return
+        if tokens[2] == "round":
+            self.round = int(tokens[3])
+        elif tokens[2] == "field":
+            self.update_field(tokens[3])
+
+    def update_field(self, field_data):
+        """Decode the new field straight into a bitboard grid and find the
+        joint move that led to it from the previous one."""
+        self.field_data = field_data
+        previous = self.grid
+        self.grid = LRGrid(field_data, self.field_height, self.field_width, str(self.my_botid),
+                           str(self.other_botid))
+        self.last_moves = None
+        if previous is not None and previous.tables is self.grid.tables:
+            moves = previous.moves_to(self.grid)
+            if None not in moves:
+                self.last_moves = moves
+
+    def parse_action(self, tokens):
+        if tokens[1] == "move":
+            # start timer
+            self.last_update = time.monotonic()
+            self.last_timebank = int(tokens[2])
+
+    def parse_quit(self, tokens):
+        pass
 
     def time_remaining(self):
-        return self.last_timebank - int(1000 * (time.clock() - self.last_update))
+        return self.last_timebank - int(1000 * (time.monotonic() - self.last_update))
 
     def issue_order(self, order):
         """issue an order, noting that (col, row) is the expected output
@@ -82,34 +137,41 @@ class Game():
         sys.stdout.flush()
 
     def run(self):
-        'parse input, update game state and call the bot classes do_turn method'
-        not_finished = True
-        data = ''
-        #my_bot = Bot(self)
-        while(not_finished):
+        'parse input line by line, update game state and call the bot classes do_turn method'
+        # one bot for the whole game, so what it learned carries over turns
+        my_bot = None
+        while True:
             try:
-                current_line = sys.stdin.readline().rstrip('\r\n')
-                data += current_line + "\n"
-                if current_line.lower().startswith("update game field"):
-                    #sys.stderr.write("UPDATE")
-                    #sys.stderr.flush()
-                    self.update(data)
-                    my_bot = Bot(self)
-                    data = ''
-                elif current_line.lower().startswith("action move"):
-                    #sys.stderr.write("ACTION")
-                    #sys.stderr.flush()
-                    self.update(data)
+                line = sys.stdin.readline()
+                # the ponder thread shares the engine and the board, so
+                # it has to be out of the way before any state changes
+                if my_bot is not None:
+                    my_bot.stop_pondering()
+                if not line:
+                    break
+                start = time.perf_counter()
+                command = self.parse_line(line)
+                if command == "update" and line.startswith("update game field"):
+                    if my_bot is None:
+                        my_bot = Bot(self)
+                    else:
+                        my_bot.update(self)
+                # everything between two decisions counts as parsing
+                self.parse_seconds += time.perf_counter() - start
+                # only 'action move' starts the clock, other requests get no answer
+                if command == "action" and line.split()[1:2] == ["move"]:
                     self.issue_order(my_bot.do_turn())
-                    data = ''
-                elif current_line.lower().startswith("quit"):
-                    not_finished = False
-            except EOFError:
-                break
+                    self.parse_seconds = 0.0
+                    my_bot.start_pondering()
+                elif command == "quit":
+                    if my_bot is not None:
+                        my_bot.save()
+                    break
             except KeyboardInterrupt:
                 raise
             except:
-                # don't raise error or return so that bot attempts to stay alive
+                # don't raise error or return so that bot attempts to stay alive;
+                # traceback is only imported here, it is slow to load at start-up
+                import traceback
                 traceback.print_exc(file=sys.stderr)
                 sys.stderr.flush()
-
@@ -1,111 +1,330 @@
-import numpy as np
+import random
 
+from Bot.static import bundled
 
-def get_valid_actions(field, x, y, rows, cols):
-    possible_actions = []
-    if (x + 1) < rows and (field[x + 1, y] == '.'):
-        possible_actions.append('down')
-    if (x - 1) >= 0 and (field[x - 1, y] == '.'):
-        possible_actions.append('up')
-    if (y + 1) < cols and (field[x, y + 1] == '.'):
-        possible_actions.append('right')
-    if (y - 1) >= 0 and (field[x, y - 1] == '.'):
-        possible_actions.append('left')
-    return possible_actions
+# action encoding shared with gym_lightriders.envs.LightRidersEnv
+# 0 == up, 1 == down, 2 == left, 3 == right
+ACTIONS = ('up', 'down', 'left', 'right')
+ACTION_INDEX = {a: i for i, a in enumerate(ACTIONS)}
 
+STEP_REWARD = 0.5
+LOSS_REWARD = -100
+WIN_REWARD = 100
+# fixed seed, so Zobrist hashes are stable between runs
+ZOBRIST_SEED = 0x11947
 
-def get_reward(field, x, y, enemy_id):
-    if field[x,y] == 'x':
-        return -100
-    return 0.5
+
+class BoardTables:
+    """Static per-board-size lookup tables.
+
+    Cells are numbered row-major (cell = row * cols + col) and a board is a
+    python int with bit `cell` set for every blocked cell.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        self.full = (1 << self.size) - 1
+        # cells outside the first / last column, used to mask row wrap-around
+        # when shifting whole bitboards sideways
+        self.not_first_col = 0
+        self.not_last_col = 0
+        # cells with an even row + col, the "white" squares of a checkerboard
+        self.even_cells = 0
+        # steps[cell][action] is the target cell or -1 when leaving the board
+        self.steps = []
+        # neighbours[cell] is the bitmask of all on-board neighbours
+        self.neighbours = []
+        for cell in range(self.size):
+            x, y = divmod(cell, cols)
+            targets = (
+                cell - cols if x > 0 else -1,
+                cell + cols if x < rows - 1 else -1,
+                cell - 1 if y > 0 else -1,
+                cell + 1 if y < cols - 1 else -1,
+            )
+            self.steps.append(targets)
+            mask = 0
+            for t in targets:
+                if t >= 0:
+                    mask |= 1 << t
+            self.neighbours.append(mask)
+            if (x + y) % 2 == 0:
+                self.even_cells |= 1 << cell
+            if y > 0:
+                self.not_first_col |= 1 << cell
+            if y < cols - 1:
+                self.not_last_col |= 1 << cell
+        # Zobrist keys for a wall, my rider and the enemy rider on every cell
+        rng = random.Random(ZOBRIST_SEED ^ (rows << 16) ^ cols)
+        self.wall_keys = [rng.getrandbits(64) for _ in range(self.size)]
+        self.my_keys = [rng.getrandbits(64) for _ in range(self.size)]
+        self.enemy_keys = [rng.getrandbits(64) for _ in range(self.size)]
+
+    def expand(self, bits):
+        # every cell adjacent to a cell in bits, all cells at once
+        return (((bits << 1) & self.not_first_col) | ((bits >> 1) & self.not_last_col) |
+                ((bits << self.cols) & self.full) | (bits >> self.cols))
+
+    def action_to(self, cell, target):
+        # index of the action leading from cell to target, None if not adjacent
+        targets = self.steps[cell]
+        return targets.index(target) if target >= 0 and target in targets else None
+
+
+_TABLES = {}
+
+
+def pack_bits(array):
+    # numpy bool array (any shape, row-major) -> bitboard
+    import numpy as np
+    return int.from_bytes(np.packbits(np.asarray(array, dtype=bool).reshape(-1), bitorder='little').tobytes(), 'little')
+
+
+def unpack_bits(bits, size):
+    # bitboard -> numpy bool array of length size, bit i at index i
+    import numpy as np
+    raw = np.frombuffer(bits.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little')[:size].astype(bool)
+
+
+def decode_field(field_data, size, my_id, enemy_id):
+    """Engine field string -> (walls bitboard, my cell, enemy cell), -1 for
+    a rider that is not on the board.
+
+    With single character tokens the whole field is translated to a binary
+    number in one go; anything else falls back to a token by token scan.
+    """
+    table = _field_table(my_id, enemy_id)
+    if table is not None:
+        raw = field_data.encode('ascii', 'replace')
+        # commas are dropped, cell 0 is the lowest bit so read backwards
+        binary = raw.translate(table, b',')[::-1]
+        if len(binary) == size and not binary.strip(b'01'):
+            return int(binary, 2), raw.find(my_id.encode()) // 2, raw.find(enemy_id.encode()) // 2
+    walls = 0
+    my_cell = enemy_cell = -1
+    for cell, token in enumerate(field_data.split(',')):
+        if token == '.':
+            continue
+        if token == my_id:
+            my_cell = cell
+        elif token == enemy_id:
+            enemy_cell = cell
+        else:
+            walls |= 1 << cell
+    return walls, my_cell, enemy_cell
+
+
+_FIELD_TABLES = {}
+
+
+def _field_table(my_id, enemy_id):
+    # bytes.translate table: walls -> '1', free cells and riders -> '0',
+    # anything unexpected -> '?' so the fast path gives up
+    key = (my_id, enemy_id)
+    if key not in _FIELD_TABLES:
+        table = None
+        if len(my_id) == 1 and len(enemy_id) == 1 and my_id.isascii() and enemy_id.isascii():
+            table = bytearray(b'?' * 256)
+            table[ord('x')] = ord('1')
+            for token in ('.', my_id, enemy_id):
+                table[ord(token)] = ord('0')
+            table = bytes(table)
+        _FIELD_TABLES[key] = table
+    return _FIELD_TABLES[key]
+
+
+def board_tables(rows, cols):
+    # tables only depend on the board size, so build them once per size,
+    # or take them from the bundle of Bot.static
+    tables = _TABLES.get((rows, cols))
+    if tables is None:
+        attributes = bundled('board', rows, cols)
+        if attributes is None:
+            tables = BoardTables(rows, cols)
+        else:
+            tables = BoardTables.__new__(BoardTables)
+            tables.__dict__.update(attributes)
+        _TABLES[(rows, cols)] = tables
+    return tables
 
 
 class LRGrid:  # Environment
+    # Bot.opponents model that moves the enemy when apply_action is not
+    # given its move; None is uniform random over the free neighbours
+    opponent = None
+
     def __init__(self, field_data, rows, cols, my_id, enemy_id):
         self.rows = rows
         self.cols = cols
-        state_arr = field_data.split(",")
-        self.field = np.array(state_arr).reshape(rows, cols)
         self.my_id = my_id
         self.enemy_id = enemy_id
-        self.my_position = np.argwhere(self.field == self.my_id)[0]
-        self.enemy_position = np.argwhere(self.field == self.enemy_id)[0]
-        # calculate possible actions and rewards per field
-        self.actions = {}
-        self.rewards = {}
-        for x in range(self.rows):
-            for y in range(self.cols):
-                self.rewards.update({(x, y): get_reward(self.field, x, y,  self.enemy_id)})
-                actions_valid = get_valid_actions(self.field, x, y, self.rows, self.cols)
-                if (len(actions_valid) > 0) and (self.field[x, y] in ['.', str(self.my_id), str(self.enemy_id)]):
-                    self.actions.update({(x, y): actions_valid})
+        self.tables = board_tables(rows, cols)
+        self.walls, self.my_cell, self.enemy_cell = decode_field(field_data, self.tables.size, my_id, enemy_id)
+        self.my_dead = False
+        self.enemy_dead = False
+        self.history = []
+
+    @classmethod
+    def from_bits(cls, walls, my_cell, enemy_cell, rows, cols, my_id='0', enemy_id='1'):
+        # build a grid straight from a wall bitboard and the two rider cells
+        grid = cls.__new__(cls)
+        grid.rows = rows
+        grid.cols = cols
+        grid.my_id = my_id
+        grid.enemy_id = enemy_id
+        grid.tables = board_tables(rows, cols)
+        grid.walls = walls
+        grid.my_cell = my_cell
+        grid.enemy_cell = enemy_cell
+        grid.my_dead = False
+        grid.enemy_dead = False
+        grid.history = []
+        return grid
+
+    def copy(self):
+        grid = LRGrid.from_bits(self.walls, self.my_cell, self.enemy_cell, self.rows, self.cols,
+                                self.my_id, self.enemy_id)
+        grid.my_dead = self.my_dead
+        grid.enemy_dead = self.enemy_dead
+        if self.opponent is not None:
+            grid.opponent = self.opponent
+        return grid
+
+    def swapped(self):
+        # the same position seen from the enemy rider
+        grid = LRGrid.from_bits(self.walls, self.enemy_cell, self.my_cell, self.rows, self.cols,
+                                self.enemy_id, self.my_id)
+        grid.my_dead = self.enemy_dead
+        grid.enemy_dead = self.my_dead
+        return grid
+
+    @property
+    def my_position(self):
+        return divmod(self.my_cell, self.cols)
+
+    @property
+    def enemy_position(self):
+        return divmod(self.enemy_cell, self.cols)
+
+    def occupied(self):
+        return self.walls | (1 << self.my_cell) | (1 << self.enemy_cell)
+
+    def free_cells(self):
+        return self.tables.full & ~self.occupied()
+
+    def valid_action_indices(self, cell):
+        free = self.free_cells()
+        return [a for a, t in enumerate(self.tables.steps[cell]) if t >= 0 and (free >> t) & 1]
+
+    def valid_actions(self, cell):
+        return [ACTIONS[a] for a in self.valid_action_indices(cell)]
+
+    def _trapped(self, cell):
+        return not (self.tables.neighbours[cell] & ~(self.walls | (1 << self.my_cell) | (1 << self.enemy_cell)))
 
     def current_state(self):
-        return (self.my_position[0], self.my_position[1])
+        return self.my_position
 
     def enemy_state(self):
-        return (self.enemy_position[0], self.enemy_position[1])
+        return self.enemy_position
 
     def is_terminal(self, s):
-        return s not in self.actions
+        cell = s[0] * self.cols + s[1]
+        return bool((self.walls >> cell) & 1) or self._trapped(cell)
 
     def enemy_lost(self):
-        return self.enemy_state() not in self.actions
+        return self.enemy_dead or self._trapped(self.enemy_cell)
 
     def i_lost(self):
-        return self.current_state() not in self.actions
+        return self.my_dead or self._trapped(self.my_cell)
 
     def game_over(self):
         return self.enemy_lost() or self.i_lost()
 
-    def move(self, action, enemy_action=None):
+    def apply_action(self, action, enemy_action=None):
+        """Play one simultaneous step in place and return my reward.
+
+        Actions are indices into ACTIONS. Every call pushes exactly one entry
+        on the history stack, so it can always be reverted with `undo_move`.
+        """
+        self.history.append((self.walls, self.my_cell, self.enemy_cell, self.my_dead, self.enemy_dead))
         # check if legal move first
         if self.i_lost():
-            return -100, self
+            return LOSS_REWARD
         if self.enemy_lost():
-            return 100, self
-        my_pos_next = np.copy(self.my_position)
-        enemy_pos_next = np.copy(self.enemy_position)
-        #        if action in self.actions[self.current_state()]:
-        if action == 'up':
-            my_pos_next[0] -= 1
-        elif action == 'down':
-            my_pos_next[0] += 1
-        elif action == 'right':
-            my_pos_next[1] += 1
-        elif action == 'left':
-            my_pos_next[1] -= 1
-
-        if (
-                my_pos_next[0] < 0 or my_pos_next[0] >= self.rows) or (
-                my_pos_next[1] < 0 or my_pos_next[1] >= self.cols) or self.field[my_pos_next[0], my_pos_next[1]] in [
-            'x', self.enemy_id]:
+            return WIN_REWARD
+        steps = self.tables.steps
+        if enemy_action is None:
+            if self.opponent is not None:
+                enemy_action = self.opponent.select(self)
+            else:
+                enemy_action = random.choice(self.valid_action_indices(self.enemy_cell))
+        my_next = steps[self.my_cell][action]
+        enemy_next = steps[self.enemy_cell][enemy_action]
+        # both riders leave a wall behind them
+        walls = self.walls | (1 << self.my_cell) | (1 << self.enemy_cell)
+        self.walls = walls
+        if my_next < 0 or (walls >> my_next) & 1:
             # we ran into wall, that's bad
-            return -100, LRGrid(self.my_id + ",x," + self.enemy_id, 1, 3, self.my_id, self.enemy_id)
-        if self.enemy_state() not in self.actions:
-            # enemy can't move
-            return 100, LRGrid(self.my_id + ",x," + self.enemy_id, 1, 3, self.my_id, self.enemy_id)
-        if enemy_action == None:
-            enemy_action = np.random.choice(self.actions[self.enemy_state()])
-        if enemy_action == 'up':
-            enemy_pos_next[0] -= 1
-        elif enemy_action == 'down':
-            enemy_pos_next[0] += 1
-        elif enemy_action == 'right':
-            enemy_pos_next[1] += 1
-        elif enemy_action == 'left':
-            enemy_pos_next[1] -= 1
-        next_field_data = np.copy(self.field)
-        next_field_data[self.current_state()[0], self.current_state()[1]] = 'x'
-        next_field_data[my_pos_next[0], my_pos_next[1]] = self.my_id
-        next_field_data[self.enemy_state()[0], self.enemy_state()[1]] = 'x'
-        next_field_data[enemy_pos_next[0], enemy_pos_next[1]] = self.enemy_id
-        # return a reward (if any)
-        next_grid = LRGrid(','.join(next_field_data.reshape(-1)), self.rows, self.cols, self.my_id, self.enemy_id)
-        return self.rewards.get(self.current_state(), -100), next_grid
+            self.my_dead = True
+        else:
+            self.my_cell = my_next
+        if enemy_next < 0 or (walls >> enemy_next) & 1:
+            self.enemy_dead = True
+        else:
+            self.enemy_cell = enemy_next
+        if my_next == enemy_next:
+            # head-on collision, nobody survives
+            self.my_dead = self.enemy_dead = True
+        if self.my_dead:
+            return LOSS_REWARD
+        if self.enemy_dead:
+            return WIN_REWARD
+        return STEP_REWARD
+
+    def apply_move(self, action, enemy_action=None):
+        # same as apply_action, with actions given by name
+        if enemy_action is not None:
+            enemy_action = ACTION_INDEX[enemy_action]
+        return self.apply_action(ACTION_INDEX[action], enemy_action)
+
+    def undo_move(self):
+        self.walls, self.my_cell, self.enemy_cell, self.my_dead, self.enemy_dead = self.history.pop()
+
+    def move(self, action, enemy_action=None):
+        # returns the reward and the successor state, leaving self untouched
+        next_grid = self.copy()
+        reward = next_grid.apply_move(action, enemy_action)
+        next_grid.history.clear()
+        return reward, next_grid
+
+    def to_field_data(self):
+        # inverse of the constructor: the engine's comma separated field
+        tokens = ['x' if (self.walls >> cell) & 1 else '.' for cell in range(self.tables.size)]
+        if not self.my_dead:
+            tokens[self.my_cell] = self.my_id
+        if not self.enemy_dead:
+            tokens[self.enemy_cell] = self.enemy_id
+        return ','.join(tokens)
+
+    def zobrist(self):
+        # hash of the position from scratch; searches update it incrementally
+        keys = self.tables.wall_keys
+        h = self.tables.my_keys[self.my_cell] ^ self.tables.enemy_keys[self.enemy_cell]
+        walls = self.walls
+        while walls:
+            low = walls & -walls
+            h ^= keys[low.bit_length() - 1]
+            walls ^= low
+        return h
+
+    def moves_to(self, grid):
+        # the (my, enemy) action indices that lead from this board to grid
+        return (self.tables.action_to(self.my_cell, grid.my_cell),
+                self.tables.action_to(self.enemy_cell, grid.enemy_cell))
 
     def all_states(self):
-        # possibly buggy but simple way to get all states
-        # either a position that has possible next actions
-        # or a position that yields a reward
-        return set(self.actions.keys()) | set(self.rewards.keys())
+        return {divmod(cell, self.cols) for cell in range(self.tables.size)}
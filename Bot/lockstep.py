@@ -0,0 +1,95 @@
+"""Many Q-learning episodes from one board, advanced together in numpy.
+
+Every episode lives in a row of a (k, rows + 2, cols + 2) wall array with
+a blocked border, flattened, so a move is an index offset and a crash a
+lookup. Each step draws the epsilon-greedy actions and the enemy moves of
+all running episodes at once and plays them by the rules of
+LRGrid.apply_action, with the rewards QLearning.play_episode gives.
+"""
+import numpy as np
+
+from Bot.grid import LOSS_REWARD, STEP_REWARD, WIN_REWARD, unpack_bits
+from Bot.opponents import random_free
+
+# the extra reward play_episode adds on top of the step reward when a
+# rider gets trapped without crashing
+TERMINAL_REWARD = 100
+
+
+class LockstepRollouts:
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        width = self.width = cols + 2
+        # index offsets of the moves on the padded board, in ACTIONS order
+        self.offsets = np.array([-width, width, -1, 1])
+        r, c = np.divmod(np.arange((rows + 2) * width), width)
+        self.border = (r == 0) | (r == rows + 1) | (c == 0) | (c == cols + 1)
+        # padded index -> board cell and back
+        self.cells = np.where(self.border, -1, (r - 1) * cols + c - 1)
+        cell = np.arange(rows * cols)
+        self.padded = (cell // cols + 1) * width + cell % cols + 1
+
+    def _positions(self, padded):
+        # padded indices -> (n, 2) (row, col) on the board
+        return np.stack(np.divmod(padded, self.width), axis=1) - 1
+
+    def _trapped(self, walls, rows, cells, others):
+        targets = cells[:, None] + self.offsets
+        return (walls[rows[:, None], targets] | (targets == others[:, None])).all(axis=1)
+
+    def play(self, grid, k, policy, eps, rng, opponent=None):
+        """Play k episodes from grid: my moves greedy on the flat per-cell
+        policy with probability 1 - eps (per episode) and uniform otherwise,
+        the enemy's by opponent.select_batch or uniform over its free moves.
+        Returns the transitions (cells, actions, rewards, next cells, dones)
+        of all episodes as flat arrays."""
+        empty = np.zeros(0, dtype=int)
+        if grid.game_over():
+            return empty, empty, np.zeros(0), empty, np.zeros(0, dtype=bool)
+        board = self.border.copy()
+        board[self.padded[unpack_bits(grid.walls, self.rows * self.cols)]] = True
+        walls = np.broadcast_to(board, (k, len(board))).copy()
+        me = np.full(k, self.padded[grid.my_cell])
+        enemy = np.full(k, self.padded[grid.enemy_cell])
+        running = np.arange(k)
+        if opponent is not None:
+            # one game per episode, kept by episode as the batch thins out
+            opponent.reset_batch(np.ones(k, dtype=bool))
+        offsets = self.offsets
+        transitions = []
+        while len(running):
+            m = me[running]
+            e = enemy[running]
+            n = len(running)
+            actions = np.where(rng.random(n) < eps[running], rng.integers(0, len(offsets), n), policy[self.cells[m]])
+            if opponent is None:
+                targets = e[:, None] + offsets
+                enemy_actions = random_free(~walls[running[:, None], targets] & (targets != m[:, None]), rng)
+            else:
+                blocked = walls[running].reshape(n, self.rows + 2, self.width)[:, 1:-1, 1:-1]
+                enemy_actions = opponent.select_batch(blocked, self._positions(e), self._positions(m), rng,
+                                                     ids=running)
+            # both riders leave a wall behind them
+            walls[running, m] = True
+            walls[running, e] = True
+            my_next = m + offsets[actions]
+            enemy_next = e + offsets[enemy_actions]
+            # head-on collision, nobody survives
+            crash = my_next == enemy_next
+            my_dead = walls[running, my_next] | crash
+            enemy_dead = walls[running, enemy_next] | crash
+            m2 = np.where(my_dead, m, my_next)
+            e2 = np.where(enemy_dead, e, enemy_next)
+            i_lost = my_dead | self._trapped(walls, running, m2, e2)
+            enemy_lost = enemy_dead | self._trapped(walls, running, e2, m2)
+            rewards = np.where(my_dead, LOSS_REWARD, np.where(enemy_dead, WIN_REWARD, STEP_REWARD))
+            trapped = ~(my_dead | enemy_dead)
+            rewards = rewards + TERMINAL_REWARD * trapped * (enemy_lost.astype(int) - i_lost)
+            done = i_lost | enemy_lost
+            transitions.append((self.cells[m], actions, rewards, self.cells[m2], done))
+            me[running] = m2
+            enemy[running] = e2
+            running = running[~done]
+        return tuple(np.concatenate(column) for column in zip(*transitions))
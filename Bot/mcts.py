@@ -0,0 +1,243 @@
+import math
+import random
+import time
+
+# exploration constant for values in [0, 1]
+EXPLORATION = 0.7
+WIN, DRAW, LOSS = 1.0, 0.5, 0.0
+# leaves evaluated per network call
+BATCH_SIZE = 16
+
+
+def outcome(grid):
+    # result of a finished game from my point of view
+    i_lost = grid.i_lost()
+    enemy_lost = grid.enemy_lost()
+    if i_lost and enemy_lost:
+        return DRAW
+    return LOSS if i_lost else WIN
+
+
+def random_playout(grid):
+    # both riders pick uniformly among their free neighbours (or crash if
+    # there is none); returns the result and the number of steps played
+    depth = 0
+    while not grid.game_over():
+        grid.apply_action(random.choice(grid.valid_action_indices(grid.my_cell)),
+                          random.choice(grid.valid_action_indices(grid.enemy_cell)))
+        depth += 1
+    return outcome(grid), depth
+
+
+def heuristic_playout(grid):
+    # like random_playout, but never step into a cell without a way out
+    # while another move is available
+    depth = 0
+    steps = grid.tables.steps
+    neighbours = grid.tables.neighbours
+    while not grid.game_over():
+        free = grid.free_cells()
+        moves = []
+        for cell in (grid.my_cell, grid.enemy_cell):
+            options = grid.valid_action_indices(cell)
+            safe = [a for a in options if neighbours[steps[cell][a]] & free & ~(1 << steps[cell][a])]
+            moves.append(random.choice(safe or options))
+        grid.apply_action(moves[0], moves[1])
+        depth += 1
+    return outcome(grid), depth
+
+
+PLAYOUTS = {'random': random_playout, 'heuristic': heuristic_playout}
+
+
+class Node:
+    """Decoupled UCT node of the simultaneous-move tree.
+
+    Both riders keep their own visit counts and value sums per action, and
+    pick independently; children are keyed by the joint move.
+    """
+    __slots__ = ('visits', 'my_actions', 'my_n', 'my_w', 'enemy_actions', 'enemy_n', 'enemy_w', 'children')
+
+    def __init__(self, grid):
+        self.visits = 0
+        # a trapped rider still has to move somewhere, and crashes
+        self.my_actions = grid.valid_action_indices(grid.my_cell) or [0]
+        self.enemy_actions = grid.valid_action_indices(grid.enemy_cell) or [0]
+        self.my_n = [0] * len(self.my_actions)
+        self.my_w = [0.0] * len(self.my_actions)
+        self.enemy_n = [0] * len(self.enemy_actions)
+        self.enemy_w = [0.0] * len(self.enemy_actions)
+        self.children = {}
+
+    def _select(self, n, w):
+        log_visits = math.log(self.visits + 1)
+        best, best_score = 0, -1.0
+        for i in range(len(n)):
+            if n[i] == 0:
+                return i
+            score = w[i] / n[i] + EXPLORATION * math.sqrt(log_visits / n[i])
+            if score > best_score:
+                best, best_score = i, score
+        return best
+
+    def select(self):
+        # returns the indices into my_actions and enemy_actions
+        return self._select(self.my_n, self.my_w), self._select(self.enemy_n, self.enemy_w)
+
+    def update(self, i, j, value):
+        self.add_visit(i, j)
+        self.add_value(i, j, value)
+
+    def add_visit(self, i, j):
+        # a visit without a value yet counts as a loss for both riders, which
+        # steers the other descents of a batch elsewhere (virtual loss)
+        self.visits += 1
+        self.my_n[i] += 1
+        self.enemy_n[j] += 1
+
+    def add_value(self, i, j, value):
+        self.my_w[i] += value
+        self.enemy_w[j] += 1.0 - value
+
+
+class MCTS:
+    """Monte Carlo Tree Search over LRGrid's simultaneous moves.
+
+    The tree survives between turns: `update` re-roots it on the joint move
+    that was actually played, so each turn starts from the simulations of
+    the previous ones.
+
+    With a Bot.network.PolicyValueNet, new leaves are scored by its value
+    head instead of a playout, batch_size leaves per forward pass.
+    """
+
+    def __init__(self, grid, playout='random', net=None, batch_size=BATCH_SIZE):
+        self.grid = grid.copy()
+        self.root = Node(self.grid)
+        self.playout = PLAYOUTS[playout]
+        self.net = net
+        self.batch_size = batch_size
+        self.iterations = 0
+
+    def update(self, grid, moves=None):
+        # moves is the (my, enemy) joint move that led to grid, when known
+        my_action, enemy_action = moves if moves is not None else self.grid.moves_to(grid)
+        child = None
+        if my_action is not None and enemy_action is not None:
+            child = self.root.children.get((my_action, enemy_action))
+        self.grid = grid.copy()
+        self.root = child if child is not None else Node(self.grid)
+
+    def iterate(self, my_index=None):
+        # my_index pins my action at the root, for pondering
+        grid = self.grid
+        node = self.root
+        path = []
+        while True:
+            i, j = node.select()
+            if my_index is not None and node is self.root:
+                i = my_index
+            path.append((node, i, j))
+            key = (node.my_actions[i], node.enemy_actions[j])
+            grid.apply_action(key[0], key[1])
+            if grid.game_over():
+                value = outcome(grid)
+                break
+            child = node.children.get(key)
+            if child is None:
+                node.children[key] = Node(grid)
+                value, depth = self.playout(grid)
+                for _ in range(depth):
+                    grid.undo_move()
+                break
+            node = child
+        for node, i, j in path:
+            node.update(i, j, value)
+            grid.undo_move()
+        self.iterations += 1
+
+    def iterate_batch(self, my_index=None):
+        """batch_size descents under virtual loss, with all new leaves valued
+        by one network call."""
+        grid = self.grid
+        pending = []
+        leaves = []
+        for _ in range(self.batch_size):
+            node = self.root
+            path = []
+            value = None
+            while True:
+                i, j = node.select()
+                if my_index is not None and node is self.root:
+                    i = my_index
+                node.add_visit(i, j)
+                path.append((node, i, j))
+                key = (node.my_actions[i], node.enemy_actions[j])
+                grid.apply_action(key[0], key[1])
+                if grid.game_over():
+                    value = outcome(grid)
+                    break
+                child = node.children.get(key)
+                if child is None:
+                    node.children[key] = Node(grid)
+                    leaves.append(grid.copy())
+                    break
+                node = child
+            for _ in path:
+                grid.undo_move()
+            if value is None:
+                pending.append(path)
+            else:
+                for node, i, j in path:
+                    node.add_value(i, j, value)
+        if leaves:
+            _, values = self.net.evaluate(leaves)
+            for path, v in zip(pending, values.tolist()):
+                value = (v + 1.0) / 2.0
+                for node, i, j in path:
+                    node.add_value(i, j, value)
+        self.iterations += self.batch_size
+
+    def _step(self, my_index=None):
+        if self.net is None:
+            self.iterate(my_index)
+        else:
+            self.iterate_batch(my_index)
+
+    def search(self, deadline):
+        if self.grid.game_over():
+            return
+        self._step()
+        while time.monotonic() < deadline:
+            self._step()
+
+    def ponder(self, action, deadline, stop):
+        """Grow the subtree below my chosen action until stopped; update keeps
+        the child for the enemy move actually played and drops the rest."""
+        root = self.root
+        if self.grid.game_over() or action not in root.my_actions:
+            return
+        i = root.my_actions.index(action)
+        while not stop.is_set() and time.monotonic() < deadline:
+            self._step(i)
+
+    def best_action(self):
+        # the most visited of my actions at the root
+        root = self.root
+        i = max(range(len(root.my_actions)), key=lambda k: root.my_n[k])
+        return root.my_actions[i]
+
+    def stats(self):
+        # cumulative counters and the win rate of the move best_action picks
+        root = self.root
+        stats = {'iterations': self.iterations, 'root_visits': root.visits}
+        if root.my_actions:
+            i = max(range(len(root.my_actions)), key=lambda k: root.my_n[k])
+            if root.my_n[i]:
+                stats['value'] = root.my_w[i] / root.my_n[i]
+        if self.net is not None:
+            stats['evaluations'] = self.net.evaluations
+        return stats
+
+    def save(self):
+        pass
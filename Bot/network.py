@@ -0,0 +1,225 @@
+"""CPU inference for small policy/value networks exported as numpy arrays.
+
+A model is a directory with one .npy file per weight and a model.json
+manifest describing three stacks of layers:
+
+    {"rows": 16, "cols": 16,
+     "trunk":  [{"type": "conv", "weight": "c1.w.npy", "bias": "c1.b.npy", "activation": "relu"}, ...],
+     "policy": [{"type": "dense", "weight": "p.w.npy", "bias": "p.b.npy"}],
+     "value":  [{"type": "dense", "weight": "v.w.npy", "bias": "v.b.npy"}]}
+
+Layouts follow PyTorch, so a state_dict exports as is: conv weights are
+(out, in, k, k) with same padding, dense weights (out, in), and a dense
+layer flattens its (channels, rows, cols) input first. The input is the
+(3, rows, cols) wall / me / enemy planes of LightRidersEnv(obs_mode='planes').
+The policy head ends in 4 logits in ACTIONS order, the value head in one
+number squashed to [-1, 1] from my point of view.
+
+Weights are memory-mapped, so loading a model costs next to nothing; they
+are only rearranged once into the channels-last layout used for inference.
+"""
+import json
+import os
+
+import numpy as np
+
+from Bot.grid import ACTIONS
+
+MANIFEST = 'model.json'
+
+
+def grid_planes(grids, out=None):
+    """(n, 3, rows, cols) float32 wall / me / enemy planes of LRGrids of
+    one size, as in the env's 'planes' observation."""
+    rows, cols = grids[0].rows, grids[0].cols
+    size = rows * cols
+    nbytes = (size + 7) // 8
+    if out is None:
+        out = np.empty((len(grids), 3, rows, cols), dtype=np.float32)
+    raw = np.frombuffer(b''.join(g.walls.to_bytes(nbytes, 'little') for g in grids), dtype=np.uint8)
+    walls = np.unpackbits(raw.reshape(len(grids), nbytes), axis=1, bitorder='little')[:, :size]
+    out[:, 0] = walls.reshape(-1, rows, cols)
+    out[:, 1:] = 0
+    for n, g in enumerate(grids):
+        # a rider that crashed is not on the board any more
+        if not g.my_dead and g.my_cell >= 0:
+            out[n, 1].flat[g.my_cell] = 1
+        if not g.enemy_dead and g.enemy_cell >= 0:
+            out[n, 2].flat[g.enemy_cell] = 1
+    return out
+
+
+def _conv(x, weight, bias):
+    # channels-last x (n, h, w, c) and weight (k, k, c, o): one matmul per
+    # kernel offset over a shifted view of the padded input
+    n, h, w, _ = x.shape
+    k = weight.shape[0]
+    pad = k // 2
+    padded = np.zeros((n, h + 2 * pad, w + 2 * pad, x.shape[3]), dtype=np.float32)
+    padded[:, pad:pad + h, pad:pad + w] = x
+    y = np.empty((n, h, w, weight.shape[3]), dtype=np.float32)
+    y[:] = bias
+    for di in range(k):
+        for dj in range(k):
+            y += padded[:, di:di + h, dj:dj + w] @ weight[di, dj]
+    return y
+
+
+def _dense(x, weight, bias):
+    # weight (in, out)
+    return x.reshape(len(x), -1) @ weight + bias
+
+
+LAYERS = {'conv': _conv, 'dense': _dense}
+
+
+def _prepare(kind, weight, shape):
+    """Exported weight -> the layout _conv / _dense compute with, given the
+    shape of one input: (h, w, c) after convolutions, else (features,)."""
+    weight = np.asarray(weight, dtype=np.float32)
+    if kind == 'conv':
+        return np.ascontiguousarray(weight.transpose(2, 3, 1, 0)), shape[:2] + (weight.shape[0],)
+    if len(shape) == 3:
+        # the export flattens (c, h, w), activations here are (h, w, c)
+        h, w, c = shape
+        weight = weight.reshape(-1, c, h, w).transpose(0, 2, 3, 1).reshape(len(weight), -1)
+    return np.ascontiguousarray(weight.T), (weight.shape[0],)
+
+
+class PolicyValueNet:
+
+    def __init__(self, rows, cols, trunk, policy, value):
+        # every stack is a list of (kind, weight, bias, relu) in the exported
+        # layout, and is kept ready to run as (function, weight, bias, relu)
+        self.rows = rows
+        self.cols = cols
+        self.layers = {'trunk': trunk, 'policy': policy, 'value': value}
+        self.trunk, shape = self._compile(trunk, (rows, cols, 3))
+        self.policy_head, _ = self._compile(policy, shape)
+        self.value_head, _ = self._compile(value, shape)
+        self.evaluations = 0
+
+    @staticmethod
+    def _compile(layers, shape):
+        compiled = []
+        for kind, weight, bias, relu in layers:
+            weight, shape = _prepare(kind, weight, shape)
+            compiled.append((LAYERS[kind], weight, bias, relu))
+        return compiled, shape
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+
+        def stack(layers):
+            return [(layer['type'],
+                     np.load(os.path.join(path, layer['weight']), mmap_mode='r'),
+                     np.load(os.path.join(path, layer['bias']), mmap_mode='r'),
+                     layer.get('activation') == 'relu') for layer in layers]
+
+        return cls(manifest['rows'], manifest['cols'], stack(manifest['trunk']), stack(manifest['policy']),
+                   stack(manifest['value']))
+
+    @classmethod
+    def random(cls, rows=16, cols=16, channels=(16, 16), hidden=64, seed=0):
+        # untrained network of the default shape, for tests and benchmarks
+        rng = np.random.default_rng(seed)
+
+        def layer(kind, shape, relu):
+            fan_in = int(np.prod(shape[1:]))
+            weight = (rng.standard_normal(shape) * np.sqrt(2.0 / fan_in)).astype(np.float32)
+            return kind, weight, np.zeros(shape[0], dtype=np.float32), relu
+
+        trunk = []
+        previous = 3
+        for c in channels:
+            trunk.append(layer('conv', (c, previous, 3, 3), True))
+            previous = c
+        flat = previous * rows * cols
+        policy = [layer('dense', (len(ACTIONS), flat), False)]
+        value = [layer('dense', (hidden, flat), True), layer('dense', (1, hidden), False)]
+        return cls(rows, cols, trunk, policy, value)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        manifest = {'rows': self.rows, 'cols': self.cols}
+        for name, layers in self.layers.items():
+            manifest[name] = []
+            for i, (kind, weight, bias, relu) in enumerate(layers):
+                entry = {'type': kind, 'weight': '%s%d.w.npy' % (name, i), 'bias': '%s%d.b.npy' % (name, i)}
+                if relu:
+                    entry['activation'] = 'relu'
+                np.save(os.path.join(path, entry['weight']), np.asarray(weight, dtype=np.float32))
+                np.save(os.path.join(path, entry['bias']), np.asarray(bias, dtype=np.float32))
+                manifest[name].append(entry)
+        with open(os.path.join(path, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+    @staticmethod
+    def _run(layers, x):
+        for f, weight, bias, relu in layers:
+            x = f(x, weight, bias)
+            if relu:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def forward(self, planes):
+        """(n, 3, rows, cols) planes -> ((n, 4) policy logits, (n,) values)."""
+        self.evaluations += len(planes)
+        features = self._run(self.trunk, planes.transpose(0, 2, 3, 1))
+        logits = self._run(self.policy_head, features)
+        values = np.tanh(self._run(self.value_head, features).reshape(-1))
+        return logits, values
+
+    def evaluate(self, grids):
+        """Policy over my legal moves and value of each LRGrid, in one batch.
+
+        Returns ((n, 4) probabilities, zero for moves into walls unless all
+        are, and (n,) values in [-1, 1]).
+        """
+        logits, values = self.forward(grid_planes(grids))
+        legal = np.zeros(logits.shape, dtype=bool)
+        for n, g in enumerate(grids):
+            if g.my_cell >= 0:
+                legal[n, g.valid_action_indices(g.my_cell)] = True
+        legal[~legal.any(axis=1)] = True
+        logits = np.where(legal, logits, -np.inf)
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities, values
+
+
+class NetworkPolicy:
+    """Plays the network's most likely legal move; one forward pass per turn."""
+
+    def __init__(self, grid, net):
+        self.grid = grid
+        self.net = net
+        self.policy = None
+        self.value = None
+
+    def update(self, grid, moves=None):
+        self.grid = grid
+        self.policy = None
+        self.value = None
+
+    def search(self, deadline):
+        if self.policy is None:
+            probabilities, values = self.net.evaluate([self.grid])
+            self.policy = probabilities[0]
+            self.value = float(values[0])
+
+    def ponder(self, action, deadline, stop):
+        pass
+
+    def best_action(self):
+        self.search(None)
+        return int(self.policy.argmax())
+
+    def stats(self):
+        return {'evaluations': self.net.evaluations, 'value': self.value}
+
+    def save(self):
+        pass
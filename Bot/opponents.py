@@ -0,0 +1,393 @@
+"""Opponent models for the simulator and the gym envs.
+
+An opponent picks the moves of the rider we are not training. It has two
+entry points:
+
+    select(grid)
+        action index for the enemy rider of an LRGrid, used by
+        LRGrid.apply_action (set grid.opponent).
+    select_batch(blocked, positions, others, rng, ids=None)
+        actions for the rider at positions (n, 2) on n boards at once, the
+        other rider at others; blocked is a (n, rows, cols) bool array of
+        walls and positions are (row, col). ids are the indices of the
+        boards among those of the last reset_batch, when only some of them
+        are still playing; None means all of them, in order. Used by the
+        vectorized env and Bot.lockstep.
+    select_one(blocked, position, other, rng)
+        the same for a single (rows, cols) board, used by LightRidersEnv;
+        numpy overhead dominates for one board, so most models do this in
+        plain python.
+
+reset() / reset_batch(mask) start new games, for opponents with a memory.
+Where a model has no opinion, and whenever it would step into a wall while
+a free move exists, it falls back to a random free move.
+"""
+import random
+
+import numpy as np
+
+from Bot.evaluate import evaluate, score
+from Bot.grid import ACTION_INDEX, ACTIONS, LRGrid, pack_bits
+
+# row/col offsets per action, in ACTIONS order
+STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DELTAS = np.array(STEPS)
+
+
+def free_moves(blocked, positions, others=None):
+    """(n, 4) mask of the moves leading to free cells on the board; with
+    others, the other rider's cell counts as taken too."""
+    n, rows, cols = blocked.shape
+    targets = positions[:, None, :] + DELTAS[None, :, :]
+    inside = (targets[..., 0] >= 0) & (targets[..., 0] < rows) & (targets[..., 1] >= 0) & (targets[..., 1] < cols)
+    r = np.clip(targets[..., 0], 0, rows - 1)
+    c = np.clip(targets[..., 1], 0, cols - 1)
+    free = inside & ~blocked[np.arange(n)[:, None], r, c]
+    if others is not None:
+        free &= ~((r == others[:, None, 0]) & (c == others[:, None, 1]))
+    return free
+
+
+def free_list(blocked, position, other):
+    # free moves on one (rows, cols) board, in plain python
+    rows, cols = blocked.shape
+    r, c = position
+    moves = []
+    for a, (dr, dc) in enumerate(STEPS):
+        rr, cc = r + dr, c + dc
+        if 0 <= rr < rows and 0 <= cc < cols and not blocked[rr, cc] and (rr != other[0] or cc != other[1]):
+            moves.append(a)
+    return moves
+
+
+def _choice(moves, rng):
+    # works with numpy Generators, RandomState and the global numpy state
+    if not moves:
+        return int(rng.random() * len(ACTIONS))
+    return moves[int(rng.random() * len(moves))]
+
+
+def random_free(free, rng):
+    # a random score plus one for every free move makes argmax pick a
+    # random free move, or any move when there is none
+    return np.argmax(rng.random(free.shape) + free, axis=1)
+
+
+def _fallback(actions, free, rng):
+    # replace moves into walls by random free moves where there are some
+    bad = ~free[np.arange(len(actions)), actions] & free.any(axis=1)
+    if bad.any():
+        actions = actions.copy()
+        actions[bad] = random_free(free[bad], rng)
+    return actions
+
+
+class Opponent:
+
+    def select(self, grid):
+        raise NotImplementedError
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        raise NotImplementedError
+
+    def select_one(self, blocked, position, other, rng):
+        return int(self.select_batch(blocked[None], np.array([position]), np.array([other]), rng)[0])
+
+    def reset(self):
+        pass
+
+    def reset_batch(self, mask):
+        pass
+
+
+class RandomValid(Opponent):
+    """Uniform over the free neighbours, the original env opponent."""
+
+    def select(self, grid):
+        moves = grid.valid_action_indices(grid.enemy_cell)
+        return random.choice(moves) if moves else random.randrange(len(ACTIONS))
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        return random_free(free_moves(blocked, positions, others), rng)
+
+    def select_one(self, blocked, position, other, rng):
+        return _choice(free_list(blocked, position, other), rng)
+
+
+class WallHugging(Opponent):
+    """Moves to the free neighbour with the fewest free neighbours of its
+    own, the usual way to fill a region without cutting it up."""
+
+    def select(self, grid):
+        tables = grid.tables
+        free = grid.free_cells()
+        moves = grid.valid_action_indices(grid.enemy_cell)
+        if not moves:
+            return random.randrange(len(ACTIONS))
+        steps = tables.steps[grid.enemy_cell]
+        counts = [bin(tables.neighbours[steps[a]] & free).count('1') for a in moves]
+        fewest = min(counts)
+        return random.choice([a for a, k in zip(moves, counts) if k == fewest])
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        n = len(positions)
+        free = free_moves(blocked, positions, others)
+        taken = blocked.copy()
+        taken[np.arange(n), positions[:, 0], positions[:, 1]] = True
+        taken[np.arange(n), others[:, 0], others[:, 1]] = True
+        counts = np.zeros((n, len(ACTIONS)))
+        for a, delta in enumerate(DELTAS):
+            counts[:, a] = free_moves(taken, positions + delta).sum(axis=1)
+        # fewest onward moves among the free moves, random among ties
+        counts = np.where(free, counts + rng.random(counts.shape), np.inf)
+        return np.where(free.any(axis=1), np.argmin(counts, axis=1), random_free(free, rng))
+
+    def select_one(self, blocked, position, other, rng):
+        moves = free_list(blocked, position, other)
+        if not moves:
+            return _choice(moves, rng)
+        taken = blocked.copy()
+        taken[position[0], position[1]] = True
+        counts = []
+        for a in moves:
+            target = (position[0] + STEPS[a][0], position[1] + STEPS[a][1])
+            counts.append(len(free_list(taken, target, other)))
+        fewest = min(counts)
+        return _choice([a for a, k in zip(moves, counts) if k == fewest], rng)
+
+
+def voronoi_counts(open_a, open_b, seeds_a, seeds_b, width):
+    """Cells rider a reaches strictly before rider b and the other way
+    round, on every board at once: both breadth-first fronts advance in
+    lock step, each over its own open cells.
+
+    Boards are flattened rows of width cells whose border is never open,
+    so a move is a shift by 1 or width; seeds are flat indices.
+    """
+    n = len(open_a)
+    boards = np.arange(n)
+    seen_a = np.zeros(open_a.shape, dtype=bool)
+    seen_b = np.zeros(open_b.shape, dtype=bool)
+    seen_a[boards, seeds_a] = True
+    seen_b[boards, seeds_b] = True
+    front_a, front_b = seen_a.copy(), seen_b.copy()
+    only_a = np.zeros(n, dtype=np.int64)
+    only_b = np.zeros(n, dtype=np.int64)
+    while True:
+        new_a = _grow(front_a, width) & open_a & ~seen_a
+        new_b = _grow(front_b, width) & open_b & ~seen_b
+        if not (new_a.any() or new_b.any()):
+            return only_a, only_b
+        only_a += np.count_nonzero(new_a & ~seen_b & ~new_b, axis=1)
+        only_b += np.count_nonzero(new_b & ~seen_a & ~new_a, axis=1)
+        seen_a |= new_a
+        seen_b |= new_b
+        front_a, front_b = new_a, new_b
+
+
+def _grow(front, width):
+    grown = front.copy()
+    grown[:, 1:] |= front[:, :-1]
+    grown[:, :-1] |= front[:, 1:]
+    grown[:, width:] |= front[:, :-width]
+    grown[:, :-width] |= front[:, width:]
+    return grown
+
+
+class GreedyTerritory(Opponent):
+    """One-ply greedy on the Voronoi territory score of Bot.evaluate: the
+    move after which the rider is closer to the most cells."""
+
+    def select(self, grid):
+        moves = grid.valid_action_indices(grid.enemy_cell)
+        if not moves:
+            return random.randrange(len(ACTIONS))
+        steps = grid.tables.steps[grid.enemy_cell]
+        walls = grid.walls | (1 << grid.enemy_cell)
+        best, best_score = moves[0], None
+        for a in moves:
+            after = LRGrid.from_bits(walls, steps[a], grid.my_cell, grid.rows, grid.cols)
+            value = score(evaluate(after))
+            if best_score is None or value > best_score:
+                best, best_score = a, value
+        return best
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        n, rows, cols = blocked.shape
+        width = cols + 2
+        free = free_moves(blocked, positions, others)
+        # every board four times, once per move, with the old cell walled,
+        # flattened with a blocked border for voronoi_counts
+        walls = np.ones((n, rows + 2, width), dtype=bool)
+        walls[:, 1:-1, 1:-1] = blocked
+        walls = np.repeat(walls.reshape(n, -1), len(ACTIONS), axis=0)
+        boards = np.arange(n * len(ACTIONS))
+        mine = np.repeat((positions[:, 0] + 1) * width + positions[:, 1] + 1, len(ACTIONS))
+        walls[boards, mine] = True
+        targets = mine + np.tile(DELTAS @ (width, 1), n)
+        ok = free.reshape(-1)
+        targets[~ok] = mine[~ok]
+        theirs = np.repeat((others[:, 0] + 1) * width + others[:, 1] + 1, len(ACTIONS))
+        # neither flood passes through the other rider
+        open_mine = ~walls
+        open_mine[boards, theirs] = False
+        open_theirs = ~walls
+        open_theirs[boards, targets] = False
+        closer, further = voronoi_counts(open_mine, open_theirs, targets, theirs, width)
+        territory = (closer - further).reshape(n, len(ACTIONS))
+        territory = np.where(free, territory + rng.random(territory.shape) * 0.5, -np.inf)
+        return np.where(free.any(axis=1), np.argmax(territory, axis=1), random_free(free, rng))
+
+    def select_one(self, blocked, position, other, rng):
+        # the bitboard evaluation beats numpy floods on a single board
+        rows, cols = blocked.shape
+        grid = LRGrid.from_bits(pack_bits(blocked), int(other[0]) * cols + int(other[1]),
+                                int(position[0]) * cols + int(position[1]), rows, cols)
+        return self.select(grid)
+
+
+class QTableSnapshot(Opponent):
+    """A frozen copy of our Q-learning bot: the greedy action of a saved
+    Bot.qtable.QTable for the rider's cell."""
+
+    def __init__(self, qtable):
+        self.policy = np.asarray(qtable.policy())
+
+    @classmethod
+    def load(cls, path):
+        from Bot.qtable import QTable
+        qtable = QTable.load(path)
+        if qtable is None:
+            raise ValueError('no usable Q-table at %r' % path)
+        return cls(qtable)
+
+    def select(self, grid):
+        action = int(self.policy[grid.enemy_position])
+        moves = grid.valid_action_indices(grid.enemy_cell)
+        return action if action in moves or not moves else random.choice(moves)
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        actions = self.policy[positions[:, 0], positions[:, 1]].astype(np.int64)
+        return _fallback(actions, free_moves(blocked, positions, others), rng)
+
+    def select_one(self, blocked, position, other, rng):
+        action = int(self.policy[position[0], position[1]])
+        moves = free_list(blocked, position, other)
+        return action if action in moves or not moves else _choice(moves, rng)
+
+
+class NetworkSnapshot(Opponent):
+    """A frozen copy of our network bot: the most likely legal move of a
+    Bot.network.PolicyValueNet, all boards in one forward pass."""
+
+    def __init__(self, net):
+        self.net = net
+
+    @classmethod
+    def load(cls, path):
+        from Bot.network import PolicyValueNet
+        return cls(PolicyValueNet.load(path))
+
+    def select(self, grid):
+        probabilities, _ = self.net.evaluate([grid.swapped()])
+        return int(probabilities[0].argmax())
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        n = len(positions)
+        planes = np.zeros((n,) + (3,) + blocked.shape[1:], dtype=np.float32)
+        planes[:, 0] = blocked
+        boards = np.arange(n)
+        planes[boards, 1, positions[:, 0], positions[:, 1]] = 1
+        planes[boards, 2, others[:, 0], others[:, 1]] = 1
+        logits, _ = self.net.forward(planes)
+        free = free_moves(blocked, positions, others)
+        logits = np.where(free | ~free.any(axis=1, keepdims=True), logits, -np.inf)
+        return np.argmax(logits, axis=1)
+
+
+class Replay(Opponent):
+    """Replays the moves of recorded games, one game per episode in turn.
+
+    games is a list of move sequences (indices into ACTIONS). Once a game
+    runs out, or a recorded move is blocked on this board, moves are
+    random free ones.
+    """
+
+    def __init__(self, games):
+        length = max((len(g) for g in games), default=0)
+        self.games = np.full((max(len(games), 1), length + 1), -1, dtype=np.int64)
+        for i, game in enumerate(games):
+            self.games[i, :len(game)] = game
+        self.game = 0
+        self.turn = 0
+        self.next_game = 0
+        self.board_game = None
+        self.board_turn = None
+
+    @classmethod
+    def load(cls, path):
+        # one game per line, moves by name separated by commas
+        with open(path) as f:
+            return cls([[ACTION_INDEX[m] for m in line.strip().split(',')] for line in f if line.strip()])
+
+    def _draw_games(self, n):
+        games = (self.next_game + np.arange(n)) % len(self.games)
+        self.next_game = int(games[-1] + 1) if n else self.next_game
+        return games
+
+    def reset(self):
+        self.game = int(self._draw_games(1)[0])
+        self.turn = 0
+
+    def reset_batch(self, mask):
+        mask = np.asarray(mask)
+        if self.board_game is None or len(self.board_game) != len(mask):
+            self.board_game = self._draw_games(len(mask))
+            self.board_turn = np.zeros(len(mask), dtype=np.int64)
+            return
+        self.board_game[mask] = self._draw_games(int(mask.sum()))
+        self.board_turn[mask] = 0
+
+    def select(self, grid):
+        action = int(self.games[self.game, min(self.turn, self.games.shape[1] - 1)])
+        self.turn += 1
+        moves = grid.valid_action_indices(grid.enemy_cell)
+        if action in moves:
+            return action
+        return random.choice(moves) if moves else random.randrange(len(ACTIONS))
+
+    def select_batch(self, blocked, positions, others, rng, ids=None):
+        if ids is None:
+            n = len(positions)
+            ids = np.arange(n)
+            if self.board_game is None or len(self.board_game) != n:
+                self.reset_batch(np.ones(n, dtype=bool))
+        turn = np.minimum(self.board_turn[ids], self.games.shape[1] - 1)
+        actions = self.games[self.board_game[ids], turn]
+        self.board_turn[ids] += 1
+        free = free_moves(blocked, positions, others)
+        unknown = actions < 0
+        actions = np.where(unknown, random_free(free, rng), actions)
+        return _fallback(actions, free, rng)
+
+    def select_one(self, blocked, position, other, rng):
+        action = int(self.games[self.game, min(self.turn, self.games.shape[1] - 1)])
+        self.turn += 1
+        moves = free_list(blocked, position, other)
+        return action if action in moves else _choice(moves, rng)
+
+
+OPPONENTS = {
+    'random': RandomValid,
+    'wall': WallHugging,
+    'greedy': GreedyTerritory,
+}
+
+
+def make_opponent(opponent):
+    """An Opponent from a name in OPPONENTS, or the opponent itself."""
+    if opponent is None or isinstance(opponent, Opponent):
+        return opponent or RandomValid()
+    if opponent not in OPPONENTS:
+        raise ValueError('unknown opponent %r, expected one of %s' % (opponent, ', '.join(OPPONENTS)))
+    return OPPONENTS[opponent]()
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+
+from Bot.grid import ACTIONS, board_tables
+
+
+class QTable:
+    """Dense Q(s, a) indexed by (row, col, action index).
+
+    Action indices follow Bot.grid.ACTIONS, which is also the encoding of
+    the gym environment. Updates are applied in batches of transitions.
+    """
+
+    def __init__(self, rows, cols, alpha=0.1, gamma=0.9):
+        self.rows = rows
+        self.cols = cols
+        self.alpha = alpha
+        self.gamma = gamma
+        self.values = np.zeros((rows, cols, len(ACTIONS)))
+        # how often every Q(s, a) has been updated, drives the learning rate
+        self.counts = np.ones((rows, cols, len(ACTIONS)))
+        # steps[cell, a] is the cell action a leads to, -1 off the board
+        self.steps = np.array(board_tables(rows, cols).steps)
+        # entries set by mark_blocked rather than learned, and what had been
+        # learned for them before, which is what save writes
+        self.crashes = np.zeros((rows, cols, len(ACTIONS)), dtype=bool)
+        self.learned = np.zeros((2, rows, cols, len(ACTIONS)))
+
+    @classmethod
+    def load(cls, path, alpha=0.1, gamma=0.9):
+        """Load a table written by `save`.
+
+        The file is memory-mapped copy-on-write, so only the pages that are
+        touched get read and updates never write back to it. Returns None
+        if there is no usable file at path.
+        """
+        try:
+            data = np.load(path, mmap_mode='c')
+        except (OSError, ValueError):
+            return None
+        if data.ndim != 4 or data.shape[0] != 2 or data.shape[3] != len(ACTIONS):
+            return None
+        table = cls(data.shape[1], data.shape[2], alpha, gamma)
+        table.values = data[0]
+        table.counts = data[1]
+        return table
+
+    def save(self, path):
+        # the walls of this game are not those of the next one, so crash
+        # markings go out as they were before they were marked
+        values = np.where(self.crashes, self.learned[0], self.values)
+        counts = np.where(self.crashes, self.learned[1], self.counts)
+        # write next to the target and rename, so a killed process never
+        # leaves a truncated table behind
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, np.stack([values, counts]))
+        os.replace(tmp, path)
+
+    def mark_blocked(self, blocked, value):
+        """Give every action running into a wall the known crash value.
+
+        blocked is a flat bool array over the board of cells that became
+        walls; moves off the board are marked too. The entries of the walls
+        themselves are kept, they are not visited again this game but are
+        worth keeping for the next. save writes marked entries as they were
+        before.
+        """
+        values = self.values.reshape(-1, len(ACTIONS))
+        marked = self.crashes.reshape(-1, len(ACTIONS))
+        crashes = ((self.steps < 0) | blocked[self.steps]) & ~marked
+        learned = self.learned.reshape(2, -1, len(ACTIONS))
+        learned[0][crashes] = values[crashes]
+        learned[1][crashes] = self.counts.reshape(-1, len(ACTIONS))[crashes]
+        values[crashes] = value
+        marked[crashes] = True
+
+    def policy(self):
+        # greedy action index for every cell, shape (rows, cols)
+        return self.values.argmax(axis=2)
+
+    def state_values(self):
+        # V*(s) = max_a Q(s, a), shape (rows, cols)
+        return self.values.max(axis=2)
+
+    def best(self, row, col):
+        q = self.values[row, col]
+        a = int(q.argmax())
+        return a, q[a]
+
+    def update(self, cells, actions, rewards, next_cells, dones, average=False):
+        """Q-learning TD step for a batch of transitions.
+
+        Cells are flat (row * cols + col) indices. Targets are computed from
+        the table before the update, then all entries move at once; returns
+        the largest absolute change. With average, the n transitions of one
+        (cell, action), as from many episodes played together, count as n
+        steps towards their mean target instead of adding up.
+        """
+        values = self.values.reshape(-1, len(ACTIONS))
+        counts = self.counts.reshape(-1, len(ACTIONS))
+        # an empty batch would come out as float arrays, which cannot index
+        cells = np.asarray(cells, dtype=np.intp)
+        actions = np.asarray(actions, dtype=np.intp)
+        next_cells = np.asarray(next_cells, dtype=np.intp)
+        # the value of the terminal state is 0 by definition
+        next_values = np.where(dones, 0.0, values[next_cells].max(axis=1))
+        targets = np.asarray(rewards) + self.gamma * next_values
+        if average:
+            entries, inverse, n = np.unique(cells * len(ACTIONS) + actions, return_inverse=True,
+                                            return_counts=True)
+            cells, actions = np.divmod(entries, len(ACTIONS))
+            targets = np.bincount(inverse, targets) / n
+            # n steps of size alpha towards the same target
+            alpha = 1 - (1 - self.alpha / counts[cells, actions]) ** n
+            visits = 0.005 * n
+        else:
+            # adaptive learning rate
+            alpha = self.alpha / counts[cells, actions]
+            visits = 0.005
+        delta = alpha * (targets - values[cells, actions])
+        np.add.at(values, (cells, actions), delta)
+        np.add.at(counts, (cells, actions), visits)
+        return np.abs(delta).max() if len(delta) else 0.0
@@ -0,0 +1,64 @@
+"""Static per-board-size tables bundled with the bot.
+
+BoardTables and Symmetries take several milliseconds to build, which the
+bot would otherwise pay on its first turn. The ones for the usual board
+sizes ship in tables.bin and are read back in well under a millisecond.
+The file is marshal data, so reading it needs no extra imports; sizes
+that are not in it, or a file from an incompatible Python or an older
+VERSION, fall back to building the tables.
+
+    python -m Bot.static 16x16 32x32
+"""
+import marshal
+import os
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables.bin')
+# bump whenever BoardTables or Symmetries change, older files are ignored
+VERSION = 1
+SIZES = ((16, 16),)
+
+_BUNDLE = None
+
+
+def bundled(kind, rows, cols):
+    """Attributes of the bundled 'board' or 'symmetries' tables of a board
+    size, None when they have to be built."""
+    global _BUNDLE
+    if _BUNDLE is None:
+        _BUNDLE = {}
+        try:
+            with open(PATH, 'rb') as f:
+                bundle = marshal.load(f)
+            if bundle.get('version') == VERSION:
+                _BUNDLE = bundle['tables']
+        except (OSError, EOFError, ValueError, TypeError, AttributeError):
+            pass
+    return _BUNDLE.get((kind, rows, cols))
+
+
+def save(sizes=SIZES, path=PATH):
+    # always built from scratch, never from an older bundle
+    from Bot.grid import BoardTables
+    from Bot.symmetry import Symmetries
+    tables = {}
+    for rows, cols in sizes:
+        tables[('board', rows, cols)] = dict(BoardTables(rows, cols).__dict__)
+        sym = dict(Symmetries(rows, cols).__dict__)
+        # restored from the board tables of the same size
+        del sym['tables']
+        tables[('symmetries', rows, cols)] = sym
+    with open(path, 'wb') as f:
+        marshal.dump({'version': VERSION, 'tables': tables}, f)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Bundle the static board tables')
+    parser.add_argument('sizes', nargs='*', default=['%dx%d' % size for size in SIZES], help='board sizes as RxC')
+    parser.add_argument('--output', default=PATH)
+    args = parser.parse_args()
+    save([tuple(int(v) for v in size.split('x')) for size in args.sizes], args.output)
+
+
+if __name__ == '__main__':
+    main()
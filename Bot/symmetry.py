@@ -0,0 +1,132 @@
+"""Board symmetries and canonical keys.
+
+A Light Riders position looks the same after mirroring the board, and on
+square boards after transposing it, as long as the actions are mirrored
+too. Keys built here are the same for every symmetric variant of a
+position, so tables and caches keyed on them share entries; the transform
+index returned with every key tells how to map actions in and out of the
+canonical frame.
+"""
+from Bot.grid import board_tables, pack_bits, unpack_bits
+from Bot.static import bundled
+
+_SYMMETRIES = {}
+
+
+def symmetries(rows, cols):
+    # built once per board size, or bundled, like board_tables
+    sym = _SYMMETRIES.get((rows, cols))
+    if sym is None:
+        attributes = bundled('symmetries', rows, cols)
+        if attributes is None:
+            sym = Symmetries(rows, cols)
+        else:
+            sym = Symmetries.__new__(Symmetries)
+            sym.__dict__.update(attributes)
+            sym.tables = board_tables(rows, cols)
+        _SYMMETRIES[(rows, cols)] = sym
+    return sym
+
+
+def _coordinate_maps(rows, cols):
+    if rows < 3 or cols < 3:
+        # too small to read the action mapping off an inner cell
+        return [lambda r, c: (r, c)]
+    maps = [
+        lambda r, c: (r, c),
+        lambda r, c: (rows - 1 - r, c),
+        lambda r, c: (r, cols - 1 - c),
+        lambda r, c: (rows - 1 - r, cols - 1 - c),
+    ]
+    if rows == cols:
+        maps += [
+            lambda r, c: (c, r),
+            lambda r, c: (cols - 1 - c, rows - 1 - r),
+            lambda r, c: (c, rows - 1 - r),
+            lambda r, c: (cols - 1 - c, r),
+        ]
+    return maps
+
+
+class Symmetries:
+    """The valid reflections of one board size.
+
+    For every transform t: perms[t][cell] is the image of cell,
+    actions[t][a] the image of action a and inverse_actions[t] maps back.
+    Zobrist keys are pre-permuted per transform so that the hash of every
+    variant can be kept up to date incrementally.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        tables = self.tables = board_tables(rows, cols)
+        self.perms = []
+        self.actions = []
+        self.inverse_actions = []
+        for f in _coordinate_maps(rows, cols):
+            perm = []
+            for cell in range(tables.size):
+                r, c = f(*divmod(cell, cols))
+                perm.append(r * cols + c)
+            self.perms.append(perm)
+            # read the action mapping off a cell with all four neighbours
+            cell = (rows // 2) * cols + cols // 2
+            amap = tuple(tables.steps[perm[cell]].index(perm[t]) for t in tables.steps[cell])
+            self.actions.append(amap)
+            self.inverse_actions.append(tuple(amap.index(a) for a in range(len(amap))))
+        self.wall_keys = [[tables.wall_keys[p] for p in perm] for perm in self.perms]
+        self.my_keys = [[tables.my_keys[p] for p in perm] for perm in self.perms]
+        self.enemy_keys = [[tables.enemy_keys[p] for p in perm] for perm in self.perms]
+
+    def wall_hashes(self, walls):
+        # Zobrist hash of the walls alone, one per transform
+        hashes = [0] * len(self.perms)
+        while walls:
+            low = walls & -walls
+            cell = low.bit_length() - 1
+            for t, keys in enumerate(self.wall_keys):
+                hashes[t] ^= keys[cell]
+            walls ^= low
+        return hashes
+
+    def child_wall_hashes(self, hashes, my_cell, enemy_cell):
+        # both riders leave a wall on the cells they move away from
+        return [h ^ keys[my_cell] ^ keys[enemy_cell] for h, keys in zip(hashes, self.wall_keys)]
+
+    def canonical(self, wall_hashes, my_cell, enemy_cell, swap=False):
+        """Smallest key over all transforms, plus the transform that gave it
+        and whether the riders had to be swapped for it. Player swap is only
+        valid for tables whose values are symmetric between the riders."""
+        best, best_t, swapped = None, 0, False
+        my_keys, enemy_keys = self.my_keys, self.enemy_keys
+        for t, h in enumerate(wall_hashes):
+            key = h ^ my_keys[t][my_cell] ^ enemy_keys[t][enemy_cell]
+            if best is None or key < best:
+                best, best_t, swapped = key, t, False
+            if swap:
+                key = h ^ my_keys[t][enemy_cell] ^ enemy_keys[t][my_cell]
+                if key < best:
+                    best, best_t, swapped = key, t, True
+        return best, best_t, swapped
+
+    def canonical_key(self, grid, swap=False):
+        return self.canonical(self.wall_hashes(grid.walls), grid.my_cell, grid.enemy_cell, swap)
+
+    def transform_bits(self, bits, t):
+        # image of a whole bitboard under transform t
+        size = self.tables.size
+        old = unpack_bits(bits, size)
+        new = old.copy()
+        new[self.perms[t]] = old
+        return pack_bits(new)
+
+    def canonical_position(self, walls, my_cell, enemy_cell):
+        """Exact canonical form (walls, my cell, enemy cell) and the transform
+        used, for tables that must not rely on hashes alone."""
+        best, best_t = None, 0
+        for t, perm in enumerate(self.perms):
+            position = (self.transform_bits(walls, t), perm[my_cell], perm[enemy_cell])
+            if best is None or position < best:
+                best, best_t = position, t
+        return best, best_t
@@ -0,0 +1,109 @@
+"""Opt-in per-turn telemetry.
+
+With RLLR_TELEMETRY set, Bot writes one JSON line per turn to stderr
+('-' or 'stderr') or appends it to the file of that name:
+
+    {"round": 12, "strategy": "alphabeta", "source": "engine", "move": "up",
+     "parse_ms": 0.3, "search_ms": 176.2, "budget_ms": 176.5, "timebank_ms": 1980,
+     "time_remaining_ms": 1803, "nodes": 5120, "nodes_per_second": 29057.4,
+     "depth": 5, "value": 31.0, "tt_hit_rate": 0.21, "eval_hit_rate": 0.48, ...}
+
+source is 'engine', 'book' or 'endgame'. Counters (nodes, steps,
+iterations, cache hits...) are the work of this turn alone, from the
+engine's stats(); value is the engine's own estimate for the chosen move.
+
+RLLR_PROFILE names a directory: every RLLR_PROFILE_EVERY-th turn then
+runs under cProfile and is dumped there as round-NNN.prof for pstats.
+
+Bot only imports this module when telemetry is on; otherwise a turn costs
+one None check.
+"""
+import json
+import os
+import sys
+import time
+
+PROFILE_DIR = os.environ.get('RLLR_PROFILE')
+PROFILE_EVERY = int(os.environ.get('RLLR_PROFILE_EVERY', '1'))
+# cumulative stats() entries that are reported per turn, and the ones a
+# rate per second is given for (the first one an engine has)
+COUNTERS = ('nodes', 'steps', 'episodes', 'iterations', 'evaluations', 'tt_hits', 'tt_probes', 'eval_hits',
+            'eval_misses')
+RATES = ('nodes', 'steps', 'iterations', 'evaluations')
+
+
+def _work(before, after, seconds):
+    record = {}
+    for key, value in after.items():
+        record[key] = value - before.get(key, 0) if key in COUNTERS else value
+    for key in RATES:
+        if key in record:
+            record[key + '_per_second'] = record[key] / seconds if seconds > 0 else None
+            break
+    if record.get('tt_probes'):
+        record['tt_hit_rate'] = record['tt_hits'] / record['tt_probes']
+    lookups = record.get('eval_hits', 0) + record.get('eval_misses', 0)
+    if lookups:
+        record['eval_hit_rate'] = record['eval_hits'] / lookups
+    return record
+
+
+class Telemetry:
+
+    def __init__(self, destination, profile_dir=PROFILE_DIR, profile_every=PROFILE_EVERY):
+        if destination in ('-', 'stderr'):
+            self.out = sys.stderr
+        else:
+            self.out = open(destination, 'a')
+        self.profile_dir = profile_dir
+        self.profile_every = max(1, profile_every)
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        self.turns = 0
+
+    def turn(self, bot, decide):
+        """Run decide() for bot, write the turn's record and return the
+        order decide returned."""
+        game = bot.game
+        engine_before = bot.engine.stats()
+        endgame_before = bot.endgame.stats()
+        budget = max(0.0, bot.deadline() - time.monotonic())
+        profiler = None
+        if self.profile_dir and self.turns % self.profile_every == 0:
+            import cProfile
+            profiler = cProfile.Profile()
+        self.turns += 1
+
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            order = decide()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        seconds = time.perf_counter() - start
+
+        record = {
+            'round': game.round,
+            'strategy': bot.strategy,
+            'source': bot.source,
+            'move': order,
+            'parse_ms': 1000 * game.parse_seconds,
+            'search_ms': 1000 * seconds,
+            'budget_ms': 1000 * budget,
+            'timebank_ms': game.last_timebank,
+            'time_remaining_ms': game.time_remaining(),
+        }
+        if bot.source == 'engine':
+            record.update(_work(engine_before, bot.engine.stats(), seconds))
+        elif bot.source == 'endgame':
+            record.update(_work(endgame_before, bot.endgame.stats(), seconds))
+            record['value'], record['proven'] = bot.endgame_result
+        if profiler is not None:
+            path = os.path.join(self.profile_dir, 'round-%03d.prof' % game.round)
+            profiler.dump_stats(path)
+            record['profile'] = path
+        self.out.write(json.dumps(record) + '\n')
+        self.out.flush()
+        return order
@@ -0,0 +1,3 @@
+"""Local referee and tournaments for Light Riders bots."""
+
+from arena.match import BotProcess, Match, Player
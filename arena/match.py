@@ -0,0 +1,247 @@
+"""One Light Riders match between two bot processes.
+
+The referee speaks the engine protocol that Bot.game.Game parses:
+
+    settings timebank 10000
+    settings time_per_move 100
+    settings player_names player0,player1
+    settings your_bot player0
+    settings your_botid 0
+    settings field_width 16
+    settings field_height 16
+    update game round 1
+    update game field .,.,0,...
+    action move 10000
+
+and expects one of up / down / left / right in reply. Each bot's timebank
+grows by time_per_move every round up to its initial size, and is charged
+the wall-clock time of every answer. A bot that answers too late, or with
+anything else, keeps going in the direction of its last move; a late
+answer is dropped when it arrives, not taken for the next round. The first
+answer also covers process start-up, so it gets STARTUP_SECONDS extra and
+is not charged.
+"""
+import os
+import random
+import selectors
+import shlex
+import subprocess
+import sys
+import time
+
+from Bot.grid import ACTION_INDEX, LRGrid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEBANK = 10000
+TIME_PER_MOVE = 100
+# a bot that never answered goes up
+DEFAULT_MOVE = 'up'
+# grace for process start-up before the first round is sent, in seconds
+STARTUP_SECONDS = 10.0
+
+
+class Player:
+    """How to start a bot: a label, a command line and extra environment.
+
+    spec is either one of our strategies ('mcts', 'alphabeta', ...), which
+    runs main.py with RLLR_STRATEGY set, or 'label=command line'.
+    """
+
+    def __init__(self, label, command, env=None):
+        self.label = label
+        self.command = command
+        self.env = env or {}
+
+    @classmethod
+    def parse(cls, spec):
+        if '=' in spec:
+            label, command = spec.split('=', 1)
+            return cls(label, shlex.split(command))
+        return cls(spec, [sys.executable, os.path.join(ROOT, 'main.py')], {'RLLR_STRATEGY': spec})
+
+    def __repr__(self):
+        return 'Player(%r)' % self.label
+
+
+class BotProcess:
+    """A running bot: lines go to its stdin, answers are collected from its
+    stdout."""
+
+    def __init__(self, player, stderr=None):
+        env = dict(os.environ)
+        env.update(player.env)
+        self.process = subprocess.Popen(player.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=stderr or subprocess.DEVNULL, env=env, cwd=ROOT)
+        self.buffer = b''
+        self.closed = False
+        # answers to rounds that timed out, still to come and to be dropped
+        self.owed = 0
+
+    def send(self, lines):
+        try:
+            self.process.stdin.write(''.join(line + '\n' for line in lines).encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def receive(self):
+        """Read what the bot has written so far; False once it exited."""
+        chunk = os.read(self.fileno(), 4096)
+        self.buffer += chunk
+        self.closed = not chunk
+        return not self.closed
+
+    def next_line(self):
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            if self.owed:
+                # the late answer to a round that already timed out
+                self.owed -= 1
+                continue
+            return line.decode(errors='replace').strip()
+        return None
+
+    def close(self):
+        self.send(['quit'])
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+def start_grid(rows, cols, rng, layout='empty'):
+    """Board with player 0 as 'my' rider, the start drawn like
+    LightRidersEnv.reset: mirrored cells away from the border."""
+    walls = 0
+    if layout != 'empty':
+        import numpy as np
+        from Bot.grid import pack_bits
+        from gym_lightriders.layouts import make_layouts
+        state = np.random.RandomState(rng.randrange(2 ** 32))
+        walls = pack_bits(make_layouts(layout, 1, rows, cols, state)[0])
+    while True:
+        row = rng.randint(1, rows - 2)
+        col = rng.randint(1, cols // 2 - 2)
+        mine, theirs = row * cols + col, row * cols + cols - 1 - col
+        if not (walls >> mine) & 1 and not (walls >> theirs) & 1:
+            return LRGrid.from_bits(walls, mine, theirs, rows, cols)
+
+
+class Match:
+    """Referee for one game; `play` returns the result as a dict."""
+
+    def __init__(self, players, rows=16, cols=16, timebank=TIMEBANK, time_per_move=TIME_PER_MOVE, seed=0,
+                 layout='empty', stderr=None):
+        self.players = players
+        self.rows = rows
+        self.cols = cols
+        self.timebank = timebank
+        self.time_per_move = time_per_move
+        self.seed = seed
+        self.layout = layout
+        self.stderr = stderr
+
+    def _settings(self, botid):
+        return [
+            'settings timebank %d' % self.timebank,
+            'settings time_per_move %d' % self.time_per_move,
+            'settings player_names %s' % ','.join('player%d' % i for i in range(2)),
+            'settings your_bot player%d' % botid,
+            'settings your_botid %d' % botid,
+            'settings field_width %d' % self.cols,
+            'settings field_height %d' % self.rows,
+        ]
+
+    @staticmethod
+    def _answers(bots, limits):
+        """Wait for one line from every bot, each with its own time limit in
+        seconds. Returns [(answer or None, ms), ...]."""
+        start = time.monotonic()
+        answers = [None] * len(bots)
+        selector = selectors.DefaultSelector()
+        for botid, bot in enumerate(bots):
+            line = bot.next_line()
+            if line is not None or bot.closed:
+                answers[botid] = (line, 0.0)
+            else:
+                selector.register(bot, selectors.EVENT_READ, botid)
+        try:
+            while selector.get_map():
+                now = time.monotonic() - start
+                waiting = [key.data for key in selector.get_map().values()]
+                timeout = min(limits[botid] for botid in waiting) - now
+                ready = selector.select(max(0.0, timeout)) if timeout > 0 else []
+                now = time.monotonic() - start
+                for key, _ in ready:
+                    bot = bots[key.data]
+                    alive = bot.receive()
+                    line = bot.next_line()
+                    if line is not None or not alive:
+                        answers[key.data] = (line, 1000 * now)
+                        selector.unregister(bot)
+                for botid in waiting:
+                    if answers[botid] is None and now >= limits[botid]:
+                        answers[botid] = (None, 1000 * now)
+                        bots[botid].owed += 1
+                        selector.unregister(bots[botid])
+        finally:
+            selector.close()
+        return answers
+
+    def play(self):
+        grid = start_grid(self.rows, self.cols, random.Random(self.seed), self.layout)
+        bots = [BotProcess(p, self.stderr) for p in self.players]
+        timebanks = [self.timebank, self.timebank]
+        latencies = [[], []]
+        timeouts = [0, 0]
+        moves = [[], []]
+        last = [DEFAULT_MOVE, DEFAULT_MOVE]
+        try:
+            for botid, bot in enumerate(bots):
+                bot.send(self._settings(botid))
+            turn = 0
+            while not grid.game_over():
+                turn += 1
+                field = grid.to_field_data()
+                for botid, bot in enumerate(bots):
+                    bot.send(['update game round %d' % turn, 'update game field %s' % field,
+                              'action move %d' % timebanks[botid]])
+                # both bots think at the same time, as on the real engine
+                limits = [t / 1000.0 + (STARTUP_SECONDS if turn == 1 else 0.0) for t in timebanks]
+                for botid, (answer, used) in enumerate(self._answers(bots, limits)):
+                    latencies[botid].append(used)
+                    if answer is None:
+                        timeouts[botid] += 1
+                    elif answer in ACTION_INDEX:
+                        last[botid] = answer
+                    moves[botid].append(last[botid])
+                    if turn > 1:
+                        timebanks[botid] = max(0, timebanks[botid] - int(used))
+                    timebanks[botid] = min(self.timebank, timebanks[botid] + self.time_per_move)
+                grid.apply_move(last[0], last[1])
+        finally:
+            for bot in bots:
+                bot.close()
+        if grid.i_lost() and grid.enemy_lost():
+            winner = None
+        else:
+            winner = 1 if grid.i_lost() else 0
+        return {
+            'players': [p.label for p in self.players],
+            'seed': self.seed,
+            'winner': winner,
+            'rounds': turn,
+            'latencies_ms': latencies,
+            'timeouts': timeouts,
+            'moves': moves,
+        }
+
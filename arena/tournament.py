@@ -0,0 +1,161 @@
+"""Round-robin tournaments between Light Riders bots.
+
+Every pair of players meets on `games` seeded start positions, each played
+twice with the sides swapped, and matches run in parallel worker processes.
+The report has win rates with 95% Wilson intervals per pairing and the
+answer latency distribution of every bot:
+
+    python -m arena.tournament --bot mcts --bot alphabeta --games 20 --workers 4
+    python -m arena.tournament --bot mcts --bot 'old=python /path/to/old/main.py'
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+
+from arena.match import TIME_PER_MOVE, TIMEBANK, Match, Player
+from gym_lightriders.layouts import LAYOUTS
+
+# z for a two-sided 95% interval
+Z = 1.96
+
+
+def wilson_interval(score, n, z=Z):
+    """Wilson score interval of a rate measured as score out of n."""
+    if n == 0:
+        return 0.0, 1.0
+    p = score / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def _play(job):
+    players, seed, board = job
+    return Match(players, seed=seed, **board).play()
+
+
+class Tournament:
+    """Every player against every other on the same start positions."""
+
+    def __init__(self, players, games=10, workers=None, seed=0, rows=16, cols=16, timebank=TIMEBANK,
+                 time_per_move=TIME_PER_MOVE, layout='empty'):
+        if len({p.label for p in players}) != len(players):
+            raise ValueError('player labels must be unique')
+        self.players = players
+        self.games = games
+        # both bots of a match think at the same time
+        self.workers = workers or max(1, multiprocessing.cpu_count() // 2)
+        self.seed = seed
+        self.board = {'rows': rows, 'cols': cols, 'timebank': timebank, 'time_per_move': time_per_move,
+                      'layout': layout}
+        self.results = []
+
+    def jobs(self):
+        jobs = []
+        for a, b in itertools.combinations(self.players, 2):
+            for game in range(self.games):
+                seed = self.seed + game
+                jobs.append(([a, b], seed, self.board))
+                jobs.append(([b, a], seed, self.board))
+        return jobs
+
+    def run(self):
+        jobs = self.jobs()
+        if self.workers == 1:
+            self.results = [_play(job) for job in jobs]
+        else:
+            with multiprocessing.Pool(self.workers) as pool:
+                self.results = pool.map(_play, jobs, chunksize=1)
+        return self.report()
+
+    def report(self):
+        pairings = {}
+        bots = {p.label: {'latencies_ms': [], 'timeouts': 0, 'moves': 0} for p in self.players}
+        for result in self.results:
+            labels = result['players']
+            for botid, label in enumerate(labels):
+                bots[label]['latencies_ms'].extend(result['latencies_ms'][botid])
+                bots[label]['timeouts'] += result['timeouts'][botid]
+                bots[label]['moves'] += len(result['moves'][botid])
+            first, second = sorted(labels)
+            pairing = pairings.setdefault('%s vs %s' % (first, second),
+                                          {'wins': 0, 'draws': 0, 'losses': 0, 'rounds': 0})
+            pairing['rounds'] += result['rounds']
+            if result['winner'] is None:
+                pairing['draws'] += 1
+            elif labels[result['winner']] == first:
+                pairing['wins'] += 1
+            else:
+                pairing['losses'] += 1
+        for pairing in pairings.values():
+            n = pairing['wins'] + pairing['draws'] + pairing['losses']
+            # wins, draws and losses from the first label's point of view
+            score = pairing['wins'] + pairing['draws'] / 2.0
+            pairing['games'] = n
+            pairing['score'] = score / n
+            pairing['score_ci95'] = wilson_interval(score, n)
+            pairing['rounds'] = pairing['rounds'] / n
+        for stats in bots.values():
+            latencies = stats.pop('latencies_ms')
+            if latencies:
+                for q in (50, 90, 99):
+                    stats['latency_ms_p%d' % q] = percentile(latencies, q)
+                stats['latency_ms_max'] = max(latencies)
+        return {'games_per_pairing': 2 * self.games, 'board': self.board, 'seed': self.seed,
+                'pairings': pairings, 'bots': bots}
+
+    def write_logs(self, path):
+        """One move file per player in the Bot.opponents.Replay format: a
+        game per line, its moves comma-separated."""
+        os.makedirs(path, exist_ok=True)
+        logs = {}
+        for result in self.results:
+            for botid, label in enumerate(result['players']):
+                logs.setdefault(label, []).append(','.join(result['moves'][botid]))
+        for label, games in logs.items():
+            with open(os.path.join(path, '%s.txt' % label), 'w') as f:
+                f.write('\n'.join(games) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LightRiders round-robin tournament')
+    parser.add_argument('--bot', action='append', required=True,
+                        help="a strategy name or 'label=command line', at least twice")
+    parser.add_argument('--games', type=int, default=10, help='start positions per pairing, each played both ways')
+    parser.add_argument('--workers', type=int, default=max(1, multiprocessing.cpu_count() // 2))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--cols', type=int, default=16)
+    parser.add_argument('--layout', choices=LAYOUTS, default='empty')
+    parser.add_argument('--timebank', type=int, default=TIMEBANK)
+    parser.add_argument('--time-per-move', type=int, default=TIME_PER_MOVE)
+    parser.add_argument('--log', help='directory for per-player move logs')
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+    if len(args.bot) < 2:
+        parser.error('a tournament needs at least two --bot')
+
+    tournament = Tournament([Player.parse(spec) for spec in args.bot], args.games, args.workers, args.seed,
+                            args.rows, args.cols, args.timebank, args.time_per_move, args.layout)
+    report = tournament.run()
+    if args.log:
+        tournament.write_logs(args.log)
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
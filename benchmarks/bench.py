@@ -0,0 +1,279 @@
+"""Reproducible performance benchmarks.
+
+Measures simulator and env throughput, bot construction and decision
+latency on recorded opening / midgame / endgame positions, peak memory,
+and the cold start of a fresh bot process, and prints one JSON document
+so runs can be diffed between commits:
+
+    python benchmarks/bench.py --output bench.json
+    python benchmarks/bench.py --record    # regenerate positions.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Bot.evaluate import evaluate  # noqa: E402
+from Bot.game import Game  # noqa: E402
+from Bot.grid import ACTIONS, LRGrid  # noqa: E402
+from Bot.bot import SAFETY_MARGIN_MS, TIME_FRACTION, Bot  # noqa: E402
+
+POSITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'positions.json')
+ROWS = COLS = 16
+MIDGAME_ROUND = 25
+
+
+def start_grid(rng):
+    # same start distribution as LightRidersEnv.reset
+    row = rng.randint(1, ROWS - 2)
+    col = rng.randint(1, COLS // 2 - 2)
+    field = ['.'] * (ROWS * COLS)
+    field[row * COLS + col] = '0'
+    field[row * COLS + COLS - 1 - col] = '1'
+    return LRGrid(','.join(field), ROWS, COLS, '0', '1')
+
+
+def random_valid(rng, grid, cell):
+    moves = grid.valid_action_indices(cell)
+    return rng.choice(moves) if moves else 0
+
+
+def record_positions(seed, per_phase):
+    """Play seeded random games and keep positions from each phase."""
+    rng = random.Random(seed)
+    phases = {'opening': [], 'midgame': [], 'endgame': []}
+    while any(len(p) < per_phase for p in phases.values()):
+        grid = start_grid(rng)
+        round = 1
+        found_midgame = found_endgame = False
+        while not grid.game_over():
+            entry = {'round': round, 'field': grid.to_field_data()}
+            if round == 1 and len(phases['opening']) < per_phase:
+                phases['opening'].append(entry)
+            if round == MIDGAME_ROUND and not found_midgame and len(phases['midgame']) < per_phase:
+                phases['midgame'].append(entry)
+                found_midgame = True
+            if not found_endgame and len(phases['endgame']) < per_phase and evaluate(grid).separated:
+                phases['endgame'].append(entry)
+                found_endgame = True
+            grid.apply_action(random_valid(rng, grid, grid.my_cell), random_valid(rng, grid, grid.enemy_cell))
+            round += 1
+    with open(POSITIONS, 'w') as f:
+        json.dump({'seed': seed, 'rows': ROWS, 'cols': COLS, 'phases': phases}, f, indent=1)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def bench_grid(seed, seconds):
+    # steps/s through the copying move() and the in-place apply/undo path
+    results = {}
+    for name in ('move', 'apply_undo'):
+        rng = random.Random(seed)
+        random.seed(seed)
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            grid = start_grid(rng)
+            depth = 0
+            while not grid.game_over():
+                action = random_valid(rng, grid, grid.my_cell)
+                if name == 'move':
+                    _, grid = grid.move(ACTIONS[action])
+                else:
+                    grid.apply_action(action)
+                    depth += 1
+                steps += 1
+            for _ in range(depth):
+                grid.undo_move()
+        results[name + '_steps_per_second'] = steps / (time.perf_counter() - start)
+    return results
+
+
+def bench_env(seed, seconds):
+    try:
+        from gym_lightriders.envs import LightRidersEnv
+    except ImportError as e:
+        return {'error': str(e)}
+    import numpy as np
+    np.random.seed(seed)
+    env = LightRidersEnv()
+    steps = 0
+    start = time.perf_counter()
+    env.reset()
+    while time.perf_counter() - start < seconds:
+        _, _, done, _ = env.step(np.random.randint(4))
+        steps += 1
+        if done:
+            env.reset()
+    return {'steps_per_second': steps / (time.perf_counter() - start)}
+
+
+def protocol_lines(entry, timebank, time_per_move):
+    # what the engine sends up to the first action of a position
+    return [
+        'settings timebank %d' % timebank,
+        'settings time_per_move %d' % time_per_move,
+        'settings your_botid 0',
+        'settings field_width %d' % COLS,
+        'settings field_height %d' % ROWS,
+        'update game round %d' % entry['round'],
+        'update game field %s' % entry['field'],
+    ]
+
+
+def make_game(entry, timebank, time_per_move):
+    game = Game()
+    game.update('\n'.join(protocol_lines(entry, timebank, time_per_move)))
+    return game
+
+
+def decide(entry, strategy, timebank, time_per_move, seed):
+    # (construction ms, decision ms) for one position
+    random.seed(seed)
+    game = make_game(entry, timebank, time_per_move)
+    start = time.perf_counter()
+    bot = Bot(game, strategy=strategy)
+    construct = 1000 * (time.perf_counter() - start)
+    game.update('action move %d' % timebank)
+    start = time.perf_counter()
+    bot.do_turn()
+    return construct, 1000 * (time.perf_counter() - start)
+
+
+def bench_bot(positions, strategy, timebank, time_per_move, repeat, seed):
+    """Bot(game) construction and do_turn latency per phase, in ms, and how
+    far decisions ran past the budget Bot.deadline gives them."""
+    budget = TIME_FRACTION * timebank - SAFETY_MARGIN_MS
+    results = {}
+    for phase, entries in positions['phases'].items():
+        construct = []
+        decisions = []
+        for _ in range(repeat):
+            for entry in entries:
+                c, d = decide(entry, strategy, timebank, time_per_move, seed)
+                construct.append(c)
+                decisions.append(d)
+        # tracemalloc slows everything down, so memory gets a pass of its own
+        tracemalloc.start()
+        for entry in entries:
+            decide(entry, strategy, timebank, time_per_move, seed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[phase] = {
+            'construct_ms_p50': percentile(construct, 50),
+            'construct_ms_p99': percentile(construct, 99),
+            'decide_ms_p50': percentile(decisions, 50),
+            'decide_ms_p99': percentile(decisions, 99),
+            'max_overrun_ms': max(0.0, max(decisions) - budget),
+            'decisions': len(decisions),
+            'peak_traced_bytes': peak,
+        }
+    return results
+
+
+def bench_startup(positions, strategies, timebank, time_per_move, repeat):
+    """Cold start in fresh processes, in ms: the bare interpreter, importing
+    the bot, and main.py answering its first action on the first opening
+    and midgame position (start-up, first turn and the move itself)."""
+    def run(args, stdin=b'', env=None):
+        start = time.perf_counter()
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, cwd=ROOT, env=env)
+        process.stdin.write(stdin)
+        process.stdin.flush()
+        process.stdout.readline()
+        elapsed = 1000 * (time.perf_counter() - start)
+        process.stdin.close()
+        process.wait()
+        process.stdout.close()
+        return elapsed
+
+    def best(args, **kwargs):
+        return min(run(args, **kwargs) for _ in range(repeat))
+
+    results = {
+        'python_ms': best([sys.executable, '-c', 'print()']),
+        'import_ms': best([sys.executable, '-c', 'import Bot.game; print()']),
+    }
+    for strategy in strategies:
+        env = dict(os.environ, RLLR_STRATEGY=strategy)
+        results[strategy] = {}
+        for phase in ('opening', 'midgame'):
+            lines = protocol_lines(positions['phases'][phase][0], timebank, time_per_move)
+            lines.append('action move %d' % timebank)
+            stdin = ''.join(line + '\n' for line in lines).encode()
+            results[strategy]['first_answer_ms_' + phase] = best([sys.executable, 'main.py'], stdin=stdin, env=env)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LightRiders performance benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=2.0, help='duration of each throughput run')
+    parser.add_argument('--strategies', default='qlearning,mcts,alphabeta')
+    parser.add_argument('--timebank', type=int, default=2000)
+    parser.add_argument('--time-per-move', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--record', action='store_true', help='regenerate positions.json and exit')
+    parser.add_argument('--per-phase', type=int, default=5, help='positions per phase when recording')
+    args = parser.parse_args()
+
+    if args.record:
+        record_positions(args.seed, args.per_phase)
+        return
+
+    with open(POSITIONS) as f:
+        positions = json.load(f)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'timebank': args.timebank,
+        'time_per_move': args.time_per_move,
+        'grid': bench_grid(args.seed, args.seconds),
+        'env': bench_env(args.seed, args.seconds),
+        'bot': {},
+        'startup': bench_startup(positions, args.strategies.split(','), args.timebank, args.time_per_move,
+                                 args.repeat),
+    }
+    for strategy in args.strategies.split(','):
+        report['bot'][strategy] = bench_bot(positions, strategy, args.timebank, args.time_per_move,
+                                            args.repeat, args.seed)
+    try:
+        import resource
+        # KiB on linux
+        report['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        pass
+
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,4 +3,26 @@ from gym.envs.registration import register
 register(
     id='LightRiders-v0',
     entry_point='gym_lightriders.envs:LightRidersEnv',
-)
\ No newline at end of file
+)
+
+register(
+    id='LightRidersVec-v0',
+    entry_point='gym_lightriders.envs:LightRidersVecEnv',
+)
+
+# parameterized boards: LightRiders32x32-v0, LightRiders64x64Pillars-v0,
+# LightRidersVec16x16Random-v0, ... for every size and layout preset
+for _size in (16, 32, 64):
+    for _layout in ('empty', 'pillars', 'ring', 'random'):
+        _name = '%dx%d%s' % (_size, _size, '' if _layout == 'empty' else _layout.capitalize())
+        _kwargs = {'rows': _size, 'cols': _size, 'layout': _layout}
+        register(
+            id='LightRiders%s-v0' % _name,
+            entry_point='gym_lightriders.envs:LightRidersEnv',
+            kwargs=_kwargs,
+        )
+        register(
+            id='LightRidersVec%s-v0' % _name,
+            entry_point='gym_lightriders.envs:LightRidersVecEnv',
+            kwargs=_kwargs,
+        )
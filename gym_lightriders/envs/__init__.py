@@ -1,3 +1,4 @@
 """Banana Gym Enviornments."""
 
-from gym_lightriders.envs.light_rider_env import  LightRidersEnv
\ No newline at end of file
+from gym_lightriders.envs.light_rider_env import  LightRidersEnv
+from gym_lightriders.envs.light_riders_vec_env import LightRidersVecEnv
@@ -1,5 +1,4 @@
 # core modules
-import pkg_resources
 import random
 
 # 3rd party modules
@@ -8,21 +7,69 @@ import gym
 from gym.utils import seeding
 import numpy as np
 
+from Bot.evaluate import board_evaluation, score
+from Bot.opponents import make_opponent
+from gym_lightriders.layouts import DENSITY, fixed_layout, make_layouts, start_positions
+
 
 class LightRidersEnv(gym.Env):
     metadata = {'render.modes': ['human']}
 
-    def __init__(self):
+    def __init__(self, shaping=0.0, obs_mode='flat', obs_view=False, rows=16, cols=16, layout='empty',
+                 density=DENSITY, opponent=None):
+        """
+        opponent moves the other rider: a Bot.opponents.Opponent or a name
+        from Bot.opponents.OPPONENTS, uniform random over free moves by
+        default.
+
+        The board is rows x cols with the obstacles of layout, a preset name
+        or a (rows, cols) array, see gym_lightriders.layouts; 'random'
+        blocks every cell with probability density, new for every episode.
+
+        shaping > 0 adds shaping * (change in Voronoi territory score) to
+        every non-terminal reward, see Bot.evaluate.
+
+        obs_mode 'flat' gives the turn flag followed by the board encoded as
+        in _get_obs, 'planes' gives a (3, rows, cols) stack of wall / me /
+        enemy masks. The planes leave out the turn flag: they are already
+        seen from my side and both riders move at once, so being player 0
+        or 1 does not change the position (Bot.network takes the same three
+        planes). Observations are written into one preallocated uint8
+        buffer; with obs_view=True a read-only view of it is returned
+        (valid until the next step), otherwise a copy.
+        """
         self._seed = -1
         self.seed()
-        self.rows = 16
-        self.cols = 16
-        self.grid = np.zeros((self.rows, self.cols))
+        self.rows = rows
+        self.cols = cols
+        self.layout = layout
+        self.density = density
+        # None when the layout is drawn anew for every episode
+        self._fixed_layout = fixed_layout(layout, rows, cols)
+        self.grid = np.zeros((self.rows, self.cols), dtype=np.uint8)
         self.action_space = gym.spaces.Discrete(4)
-        self.observation_space = gym.spaces.Box(0, 4, (self.rows * self.cols + 1,))
+        if obs_mode == 'flat':
+            self.observation_space = gym.spaces.Box(0, 3, (self.rows * self.cols + 1,), dtype=np.uint8)
+        elif obs_mode == 'planes':
+            self.observation_space = gym.spaces.Box(0, 1, (3, self.rows, self.cols), dtype=np.uint8)
+        else:
+            raise ValueError("obs_mode must be 'flat' or 'planes'")
+        self.obs_mode = obs_mode
+        self.obs_view = obs_view
+        self._obs = np.zeros(self.observation_space.shape, dtype=np.uint8)
+        self._obs_readonly = self._obs.view()
+        self._obs_readonly.flags.writeable = False
+        # board part of the flat buffer, as a (rows, cols) view
+        self._board = self._obs[1:].reshape(self.rows, self.cols) if obs_mode == 'flat' else None
         self.p0_position = [0, 0]
         self.p1_position = [0, 0]
         self.me_first = True
+        self.shaping = shaping
+        self.opponent = make_opponent(opponent)
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
 
     def _is_outside(self, pos):
         return pos[0] < 0 or pos[0] >= self.rows or pos[1] < 0 or pos[1] >= self.cols
@@ -33,22 +80,41 @@ class LightRidersEnv(gym.Env):
     def _is_loosing_position(self, pos):
         return self._is_outside(pos) or self._is_wall(pos)
 
-    def _get_obs(self):
+    def _write_obs(self):
         """
         0 == Free Space
         1 == Wall
         2 == Me
         3 == Enemy
         """
-        obs = np.copy(self.grid)
-        if not self._is_loosing_position(self.p0_position):
-            obs[self.p0_position[0], self.p0_position[1]] = 2 if self.me_first else 3
-        if not self._is_loosing_position(self.p1_position):
-            obs[self.p1_position[0], self.p1_position[1]] = 3 if self.me_first else 2
-        return np.append(np.array([0 if self.me_first else 1]), obs.reshape(-1))
+        me, enemy = self.p0_position, self.p1_position
+        if not self.me_first:
+            me, enemy = enemy, me
+        if self.obs_mode == 'flat':
+            self._obs[0] = 0 if self.me_first else 1
+            board = self._board
+            board[:] = self.grid
+            me_board = enemy_board = board
+            me_value, enemy_value = 2, 3
+        else:
+            self._obs[0] = self.grid
+            self._obs[1:] = 0
+            me_board, enemy_board = self._obs[1], self._obs[2]
+            me_value = enemy_value = 1
+        if not self._is_loosing_position(me):
+            me_board[me[0], me[1]] = me_value
+        if not self._is_loosing_position(enemy):
+            enemy_board[enemy[0], enemy[1]] = enemy_value
+
+    def _get_obs(self):
+        self._write_obs()
+        return self._obs_readonly if self.obs_view else self._obs.copy()
 
     def render(self, mode='human', close=False):
-        g = self._get_obs()[1:].reshape(self.rows, self.cols)
+        g = self.grid.copy()
+        for pos, value in ((self.p0_position, 2), (self.p1_position, 3)):
+            if not self._is_loosing_position(pos):
+                g[pos[0], pos[1]] = value if self.me_first else 5 - value
         for i in range(self.rows):
             print("---" * self.cols)
             for j in range(self.cols):
@@ -64,14 +130,17 @@ class LightRidersEnv(gym.Env):
             print("")
 
     def reset(self):
-        self.grid = np.zeros((self.rows, self.cols))
-        p0_start_x = np.random.randint(1, self.rows - 1)
-        p0_start_y = np.random.randint(1, self.cols // 2 - 1)
+        if self._fixed_layout is not None:
+            blocked = self._fixed_layout[None].copy()
+        else:
+            blocked = make_layouts(self.layout, 1, self.rows, self.cols, np.random, self.density)
+        p0_start_x, p0_start_y = (int(v[0]) for v in start_positions(blocked, np.random))
+        self.grid[:] = blocked[0]
         self.p0_position = [p0_start_x, p0_start_y]
         self.p1_position = [p0_start_x, self.cols - 1 - p0_start_y]
         self.me_first = np.random.rand() <= 0.5
-
-        print(self.me_first)
+        self.opponent.reset()
+        return self._get_obs()
 
     def step(self, action):
         """
@@ -102,13 +171,24 @@ class LightRidersEnv(gym.Env):
                  However, official evaluations of your agent are not allowed to
                  use this for learning.
         """
+        if self.shaping:
+            potential = self._potential()
         self.take_action(action)
 
         reward = self.get_reward()
         ob = self._get_obs()
         episode_over = self._is_loosing_position(self.p0_position) or self._is_loosing_position(self.p1_position)
+        if self.shaping and not episode_over:
+            reward += self.shaping * (self._potential() - potential)
         return ob, reward, episode_over, {}
 
+    def _potential(self):
+        # territory score from my point of view, in [-1, 1]
+        me, enemy = self.p0_position, self.p1_position
+        if not self.me_first:
+            me, enemy = enemy, me
+        return score(board_evaluation(self.grid == 1, me, enemy))
+
     def _update_pos(self, pos, action):
         if action == 0:
             # UP
@@ -135,42 +215,20 @@ class LightRidersEnv(gym.Env):
         2 == LEFT
         3 == RIGHT
         """
-        all_actions = [0, 1, 2, 3]
+        me, enemy = self.p0_position, self.p1_position
+        if not self.me_first:
+            me, enemy = enemy, me
+        # the enemy decides on the board as it is, like we did
+        enemy_action = self.opponent.select_one(self.grid.view(bool), enemy, me, np.random)
+        # both riders leave a wall behind them
+        self.grid[me[0], me[1]] = 1
+        self.grid[enemy[0], enemy[1]] = 1
+        me = self._update_pos(me, action)
+        enemy = self._update_pos(enemy, enemy_action)
         if self.me_first:
-            # set current position to wall
-            self.grid[self.p0_position[0], self.p0_position[1]] = 1
-            # update my position based on action
-            self.p0_position = self._update_pos(self.p0_position, action)
-
-            # calculate enemy move
-            valid_enemy_actions = list(filter(lambda x: self._is_action_possible(self.p1_position
-                                                                                 , x), all_actions))
-            enemy_action = np.random.choice(all_actions)
-            if len(valid_enemy_actions) > 0:
-                enemy_action = np.random.choice(valid_enemy_actions)
-
-            # set current enemy position to wall
-            self.grid[self.p1_position[0], self.p1_position[1]] = 1
-            # update my position based on action
-            self.p1_position = self._update_pos(self.p1_position, enemy_action)
+            self.p0_position, self.p1_position = me, enemy
         else:
-
-            # calculate enemy move
-            valid_enemy_actions = list(filter(lambda x: self._is_action_possible(self.p0_position
-                                                                                 , x), all_actions))
-            enemy_action = np.random.choice(all_actions)
-            if len(valid_enemy_actions) > 0:
-                enemy_action = np.random.choice(valid_enemy_actions)
-
-            # set current enemy position to wall
-            self.grid[self.p0_position[0], self.p0_position[1]] = 1
-            # update my position based on action
-            self.p0_position = self._update_pos(self.p0_position, enemy_action)
-
-            # set current position to wall
-            self.grid[self.p1_position[0], self.p1_position[1]] = 1
-            # update my position based on action
-            self.p1_position = self._update_pos(self.p1_position, action)
+            self.p0_position, self.p1_position = enemy, me
 
     def get_reward(self):
         """ Reward is given for XY. """
@@ -0,0 +1,159 @@
+# 3rd party modules
+import gym
+import numpy as np
+
+from Bot.opponents import make_opponent
+from gym_lightriders.layouts import DENSITY, make_layouts, start_positions
+
+# row/col offsets per action, same order as LightRidersEnv: UP, DOWN, LEFT, RIGHT
+DELTAS = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]])
+
+
+class LightRidersVecEnv(gym.Env):
+    """N independent LightRiders boards stepped together.
+
+    The boards live in one (N, rows + 2, cols + 2) boolean array whose border
+    is permanently blocked, so leaving the board and hitting a wall are the
+    same lookup. Finished boards are reset automatically; the observation
+    they ended with is returned in info['terminal_observation'].
+    Observations are written into one preallocated float32 buffer, returned
+    as with LightRidersEnv's obs_view.
+    """
+    metadata = {'render.modes': ['human']}
+
+    def __init__(self, num_envs=16, rows=16, cols=16, layout='empty', density=DENSITY, opponent=None,
+                 obs_view=False):
+        # board size, obstacles, opponent and obs_view as in LightRidersEnv
+        self.num_envs = num_envs
+        self.rows = rows
+        self.cols = cols
+        self.layout = layout
+        self.density = density
+        self.opponent = make_opponent(opponent)
+        self.seed()
+        self.action_space = gym.spaces.MultiDiscrete([4] * num_envs)
+        self.observation_space = gym.spaces.Box(0, 3, (num_envs, self.rows * self.cols + 1), dtype=np.float32)
+        self.obs_view = obs_view
+        self._obs = np.zeros(self.observation_space.shape, dtype=np.float32)
+        self._obs_readonly = self._obs.view()
+        self._obs_readonly.flags.writeable = False
+        # board part of the buffer, as a (num_envs, rows, cols) view
+        self._board = self._obs[:, 1:].reshape(num_envs, self.rows, self.cols)
+        self.blocked = np.ones((num_envs, self.rows + 2, self.cols + 2), dtype=bool)
+        # positions are stored in padded board coordinates
+        self.my_position = np.zeros((num_envs, 2), dtype=np.int64)
+        self.enemy_position = np.zeros((num_envs, 2), dtype=np.int64)
+        self.me_first = np.zeros(num_envs, dtype=bool)
+        self._envs = np.arange(num_envs)
+
+    def seed(self, seed=None):
+        self.np_random = np.random.default_rng(seed)
+        return [seed]
+
+    def _reset_boards(self, mask):
+        n = int(mask.sum())
+        if n == 0:
+            return
+        layouts = make_layouts(self.layout, n, self.rows, self.cols, self.np_random, self.density)
+        p0_start_x, p0_start_y = start_positions(layouts, self.np_random)
+        self.blocked[mask] = True
+        self.blocked[mask, 1:-1, 1:-1] = layouts
+        p1_start_y = self.cols - 1 - p0_start_y
+        me_first = self.np_random.random(n) <= 0.5
+        # +1 everywhere for the padding
+        self.my_position[mask, 0] = p0_start_x + 1
+        self.enemy_position[mask, 0] = p0_start_x + 1
+        self.my_position[mask, 1] = np.where(me_first, p0_start_y, p1_start_y) + 1
+        self.enemy_position[mask, 1] = np.where(me_first, p1_start_y, p0_start_y) + 1
+        self.me_first[mask] = me_first
+        self.opponent.reset_batch(mask)
+
+    def _write_obs(self, my_alive=None, enemy_alive=None):
+        """
+        Same encoding as LightRidersEnv, one row per board:
+        0 == Free Space
+        1 == Wall
+        2 == Me
+        3 == Enemy
+        """
+        self._obs[:, 0] = ~self.me_first
+        board = self._board
+        board[:] = self.blocked[:, 1:-1, 1:-1]
+        envs = self._envs
+        if my_alive is None:
+            my_alive = enemy_alive = np.ones(self.num_envs, dtype=bool)
+        envs_alive = envs[my_alive]
+        board[envs_alive, self.my_position[my_alive, 0] - 1, self.my_position[my_alive, 1] - 1] = 2
+        envs_alive = envs[enemy_alive]
+        board[envs_alive, self.enemy_position[enemy_alive, 0] - 1, self.enemy_position[enemy_alive, 1] - 1] = 3
+
+    def _get_obs(self):
+        self._write_obs()
+        return self._obs_readonly if self.obs_view else self._obs.copy()
+
+    def reset(self):
+        self._reset_boards(np.ones(self.num_envs, dtype=bool))
+        return self._get_obs()
+
+    def _enemy_actions(self):
+        # the opponent sees the boards without padding
+        return self.opponent.select_batch(self.blocked[:, 1:-1, 1:-1], self.enemy_position - 1,
+                                          self.my_position - 1, self.np_random)
+
+    def step(self, actions):
+        """
+        Parameters
+        ----------
+        actions : array of shape (num_envs,) with values 0 == UP, 1 == DOWN,
+            2 == LEFT, 3 == RIGHT
+
+        Returns
+        -------
+        obs, rewards, dones, info : tuple
+            batched versions of LightRidersEnv.step; boards that finished are
+            already reset in obs.
+        """
+        envs = self._envs
+        actions = np.asarray(actions)
+        enemy_actions = self._enemy_actions()
+
+        # both riders leave a wall behind them before anyone moves
+        self.blocked[envs, self.my_position[:, 0], self.my_position[:, 1]] = True
+        self.blocked[envs, self.enemy_position[:, 0], self.enemy_position[:, 1]] = True
+        self.my_position += DELTAS[actions]
+        self.enemy_position += DELTAS[enemy_actions]
+
+        head_on = np.all(self.my_position == self.enemy_position, axis=1)
+        my_lost = self.blocked[envs, self.my_position[:, 0], self.my_position[:, 1]] | head_on
+        enemy_lost = self.blocked[envs, self.enemy_position[:, 0], self.enemy_position[:, 1]] | head_on
+
+        rewards = np.full(self.num_envs, -0.1, dtype=np.float32)
+        rewards[enemy_lost] = 100
+        rewards[my_lost] = -100
+        # DRAW
+        rewards[my_lost & enemy_lost] = -50
+        dones = my_lost | enemy_lost
+
+        info = {}
+        if dones.any():
+            self._write_obs(~my_lost, ~enemy_lost)
+            info['terminal_observation'] = self._obs[dones]
+            self._reset_boards(dones)
+        return self._get_obs(), rewards, dones, info
+
+    def render(self, mode='human', close=False, index=0):
+        self._write_obs()
+        g = self._board[index]
+        for i in range(self.rows):
+            print("---" * self.cols)
+            for j in range(self.cols):
+                a = g[i, j]
+                c = '.'
+                if a == 1:
+                    c = 'x'
+                elif a == 2:
+                    c = 'u'
+                elif a == 3:
+                    c = 'e'
+                print(c.upper().center(3), end="")
+            print("")
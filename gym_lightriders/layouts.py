@@ -0,0 +1,92 @@
+"""Board sizes and obstacle layouts shared by the envs and the simulator.
+
+A layout is a boolean (rows, cols) array of blocked cells. The presets are
+left-right mirror symmetric, like the start positions, so neither rider
+gets the better half of the board:
+
+    'empty'    no obstacles
+    'pillars'  single blocked cells on a regular lattice
+    'ring'     a rectangle at a quarter of the board, open in the middle of
+               every side
+    'random'   every cell blocked with probability `density`, drawn again
+               for every episode
+
+Anything else passed as a layout is taken as a fixed array of its own.
+"""
+import numpy as np
+
+LAYOUTS = ('empty', 'pillars', 'ring', 'random')
+DENSITY = 0.1
+
+
+def _integers(rng, low, high, size):
+    # numpy Generators draw with integers, the global state and RandomState
+    # with randint
+    integers = getattr(rng, 'integers', None) or rng.randint
+    return integers(low, high, size)
+
+
+def _mirrored(blocked):
+    return blocked | blocked[..., ::-1]
+
+
+def _preset(name, rows, cols):
+    blocked = np.zeros((rows, cols), dtype=bool)
+    if name == 'pillars':
+        blocked[2:rows - 2:4, 2:cols // 2:4] = True
+    elif name == 'ring':
+        top, left = rows // 4, cols // 4
+        bottom, right = rows - 1 - top, cols - 1 - left
+        blocked[[top, bottom], left:right + 1] = True
+        blocked[top:bottom + 1, [left, right]] = True
+        blocked[[top, bottom], cols // 2 - 1:cols // 2 + 1] = False
+        blocked[rows // 2 - 1:rows // 2 + 1, [left, right]] = False
+    elif name != 'empty':
+        raise ValueError('unknown layout %r, expected one of %s' % (name, ', '.join(LAYOUTS)))
+    return _mirrored(blocked)
+
+
+def fixed_layout(layout, rows, cols):
+    """The blocked cells of a preset or custom layout, None for 'random'."""
+    if isinstance(layout, str):
+        if layout == 'random':
+            return None
+        return _preset(layout, rows, cols)
+    blocked = np.asarray(layout, dtype=bool)
+    if blocked.shape != (rows, cols):
+        raise ValueError('layout has shape %s, expected %s' % (blocked.shape, (rows, cols)))
+    return blocked
+
+
+def make_layouts(layout, n, rows, cols, rng, density=DENSITY):
+    """(n, rows, cols) boards with the obstacles of layout."""
+    blocked = fixed_layout(layout, rows, cols)
+    if blocked is not None:
+        return np.broadcast_to(blocked, (n, rows, cols)).copy()
+    # draw the left half, the right half is its mirror image
+    half = (cols + 1) // 2
+    blocked = np.zeros((n, rows, cols), dtype=bool)
+    blocked[..., :half] = rng.random((n, rows, half)) < density
+    return _mirrored(blocked)
+
+
+def start_positions(blocked, rng):
+    """Start (row, col) of player 0 on every board of blocked (n, rows,
+    cols), as in the original env: away from the border, in the left half,
+    with player 1 mirrored at (row, cols - 1 - col). Cells are drawn again
+    until both are free; boards without such a pair get theirs cleared."""
+    n, rows, cols = blocked.shape
+    boards = np.arange(n)
+    row = _integers(rng, 1, rows - 1, n)
+    col = _integers(rng, 1, cols // 2 - 1, n)
+    for _ in range(100):
+        taken = blocked[boards, row, col] | blocked[boards, row, cols - 1 - col]
+        if not taken.any():
+            break
+        k = int(taken.sum())
+        row[taken] = _integers(rng, 1, rows - 1, k)
+        col[taken] = _integers(rng, 1, cols // 2 - 1, k)
+    else:
+        blocked[boards, row, col] = False
+        blocked[boards, row, cols - 1 - col] = False
+    return row, col
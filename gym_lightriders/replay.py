@@ -0,0 +1,211 @@
+"""Compact replay storage for LightRiders transitions.
+
+A transition is stored as two bit-packed boards (one bit per cell, walls
+only), the rider positions before and after, the joint action, the reward
+and the done flag: about 80 bytes on a 16x16 board. Storage is a ring of
+fixed-size numpy arrays that live in RAM, or in memory-mapped .npy files
+once they would exceed `ram_limit` bytes. A spill directory the buffer
+created itself is removed again by `close`.
+"""
+import os
+import shutil
+import tempfile
+
+import gym
+import numpy as np
+
+
+class SumTree:
+    """Binary tree of priorities in one flat array, leaves at the end.
+
+    Updates and sampling work on whole batches of indices, one vectorised
+    step per tree level.
+    """
+
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.leaves
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        # leaf index of every prefix-sum value, walking down all at once
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0.0)
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class ReplayBuffer:
+
+    def __init__(self, capacity, rows=16, cols=16, alpha=0.6, ram_limit=256 * 2 ** 20, spill_dir=None, seed=None):
+        self.capacity = capacity
+        self.rows = rows
+        self.cols = cols
+        self.alpha = alpha
+        self.board_bytes = (rows * cols + 7) // 8
+        layout = {
+            'boards': ((capacity, self.board_bytes), np.uint8),
+            'next_boards': ((capacity, self.board_bytes), np.uint8),
+            # my row, my col, enemy row, enemy col
+            'positions': ((capacity, 4), np.uint8),
+            'next_positions': ((capacity, 4), np.uint8),
+            # my action, enemy action
+            'actions': ((capacity, 2), np.int8),
+            'rewards': ((capacity,), np.float32),
+            'dones': ((capacity,), np.bool_),
+        }
+        nbytes = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype in layout.values())
+        self.spill_dir = None
+        # only a directory of our own is deleted on close
+        self._own_spill_dir = False
+        if nbytes > ram_limit:
+            self.spill_dir = spill_dir
+            if spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix='lightriders-replay-')
+                self._own_spill_dir = True
+        for name, (shape, dtype) in layout.items():
+            if self.spill_dir is None:
+                array = np.zeros(shape, dtype=dtype)
+            else:
+                array = np.lib.format.open_memmap(os.path.join(self.spill_dir, name + '.npy'), mode='w+',
+                                                  dtype=dtype, shape=shape)
+                # plain ndarray over the same pages, np.memmap indexing is slow
+                array = np.asarray(array)
+            setattr(self, name, array)
+        self.priorities = SumTree(capacity)
+        self.max_priority = 1.0
+        self._pending = []
+        self.size = 0
+        self.next_index = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.size
+
+    def pack(self, board):
+        # (rows, cols) numpy board, non-zero == wall -> packed bytes
+        return np.packbits(np.asarray(board, dtype=bool).reshape(-1), bitorder='little')
+
+    def add(self, board, positions, actions, reward, next_board, next_positions, done):
+        """Store one transition; boards are packed byte rows (see `pack`) or
+        bitboard ints as used by Bot.grid.LRGrid."""
+        i = self.next_index
+        for target, value in ((self.boards, board), (self.next_boards, next_board)):
+            if isinstance(value, int):
+                value = np.frombuffer(value.to_bytes(self.board_bytes, 'little'), dtype=np.uint8)
+            target[i] = value
+        self.positions[i] = positions
+        self.next_positions[i] = next_positions
+        self.actions[i] = actions
+        self.rewards[i] = reward
+        self.dones[i] = done
+        # new transitions get the highest priority seen so far, written to
+        # the tree in one batch before the next sample
+        self._pending.append(i)
+        self.next_index = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_grid(self, grid, actions, reward, next_grid, done):
+        # transition between two Bot.grid.LRGrid states; actions are indices
+        # into Bot.grid.ACTIONS, -1 where unknown
+        cols = grid.cols
+        self.add(grid.walls, divmod(grid.my_cell, cols) + divmod(grid.enemy_cell, cols), actions, reward,
+                 next_grid.walls, divmod(next_grid.my_cell, cols) + divmod(next_grid.enemy_cell, cols), done)
+
+    def unpack(self, packed):
+        # (n, board_bytes) -> (n, rows, cols) bool boards
+        bits = np.unpackbits(packed, axis=1, bitorder='little')[:, :self.rows * self.cols]
+        return bits.reshape(-1, self.rows, self.cols).astype(bool)
+
+    def _flush(self):
+        if self._pending:
+            self.priorities.update(self._pending, self.max_priority ** self.alpha)
+            self._pending = []
+
+    def sample(self, batch_size, prioritized=False, beta=0.4):
+        """Uniform or prioritized batch of transitions as a dict of arrays,
+        boards unpacked. Prioritized batches carry importance weights and
+        the buffer indices for `update_priorities`."""
+        if prioritized:
+            self._flush()
+            total = self.priorities.total()
+            # one draw per equal slice of the priority mass
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+            indices = np.minimum(self.priorities.find(values), self.size - 1)
+            probabilities = self.priorities.tree[indices + self.priorities.leaves] / total
+            weights = (self.size * probabilities) ** -beta
+            weights /= weights.max()
+        else:
+            indices = self.rng.integers(0, self.size, batch_size)
+            weights = np.ones(batch_size)
+        return {
+            'indices': indices,
+            'weights': weights,
+            'boards': self.unpack(self.boards[indices]),
+            'positions': self.positions[indices],
+            'actions': self.actions[indices],
+            'rewards': self.rewards[indices],
+            'next_boards': self.unpack(self.next_boards[indices]),
+            'next_positions': self.next_positions[indices],
+            'dones': self.dones[indices],
+        }
+
+    def update_priorities(self, indices, priorities):
+        self._flush()
+        priorities = np.abs(priorities) + 1e-6
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.priorities.update(indices, priorities ** self.alpha)
+
+    def close(self):
+        if self._own_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self._own_spill_dir = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """Wraps a LightRidersEnv and stores every step in a ReplayBuffer."""
+
+    def __init__(self, env, buffer):
+        super().__init__(env)
+        self.buffer = buffer
+
+    def _state(self):
+        env = self.env.unwrapped
+        me, enemy = env.p0_position, env.p1_position
+        if not env.me_first:
+            me, enemy = enemy, me
+        # a rider that left the board is stored clipped to it
+        positions = [min(max(v, 0), n - 1) for v, n in zip(me + enemy, (env.rows, env.cols) * 2)]
+        return self.buffer.pack(env.grid), positions
+
+    def step(self, action):
+        board, positions = self._state()
+        ob, reward, done, info = self.env.step(action)
+        next_board, next_positions = self._state()
+        # the env does not expose the scripted enemy move
+        self.buffer.add(board, positions, (action, -1), reward, next_board, next_positions, done)
+        return ob, reward, done, info
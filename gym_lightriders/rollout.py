@@ -0,0 +1,215 @@
+"""Multi-process rollouts for LightRidersEnv and the LRGrid simulator.
+
+Every worker process plays its episodes independently and writes
+observations, actions and rewards straight into numpy arrays backed by
+shared memory, so nothing but a step count is pickled back to the parent.
+
+    python -m gym_lightriders.rollout --workers 8 --episodes 200 --seed 0
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Bot.opponents import OPPONENTS, make_opponent
+from gym_lightriders.layouts import DENSITY, LAYOUTS, make_layouts, start_positions
+
+ROWS = 16
+COLS = 16
+
+
+def _buffer_layout(workers, episodes, max_steps, rows, cols):
+    return {
+        'obs': ((workers, episodes, max_steps, rows * cols + 1), np.uint8),
+        'actions': ((workers, episodes, max_steps), np.int8),
+        'rewards': ((workers, episodes, max_steps), np.float32),
+        'lengths': ((workers, episodes), np.int32),
+    }
+
+
+def _attach(names, layout):
+    # returns the shared memory handles and numpy views on them
+    handles = {}
+    arrays = {}
+    for key, (shape, dtype) in layout.items():
+        handles[key] = shared_memory.SharedMemory(name=names[key])
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=handles[key].buf)
+    return handles, arrays
+
+
+def _env_episode(env, obs, actions, rewards, max_steps):
+    ob = env.reset()
+    me = env.p0_position if env.me_first else env.p1_position
+    for t in range(max_steps):
+        obs[t] = ob
+        valid = [a for a in range(4) if env._is_action_possible(me, a)]
+        action = random.choice(valid) if valid else 0
+        ob, reward, done, _ = env.step(action)
+        me = env.p0_position if env.me_first else env.p1_position
+        actions[t] = action
+        rewards[t] = reward
+        if done:
+            return t + 1
+    return max_steps
+
+
+def _grid_observation(grid, out):
+    # same encoding as LightRidersEnv._get_obs, with the turn flag first
+    size = grid.rows * grid.cols
+    bits = np.frombuffer(grid.walls.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    out[0] = 0
+    out[1:] = np.unpackbits(bits, bitorder='little')[:size]
+    if not grid.my_dead:
+        out[1 + grid.my_cell] = 2
+    if not grid.enemy_dead:
+        out[1 + grid.enemy_cell] = 3
+
+
+def _grid_episode(rng, board, obs, actions, rewards, max_steps):
+    from Bot.grid import LRGrid, ACTION_INDEX, pack_bits
+
+    rows, cols = board['rows'], board['cols']
+    blocked = make_layouts(board['layout'], 1, rows, cols, np.random, board['density'])
+    row, col = (int(v[0]) for v in start_positions(blocked, np.random))
+    grid = LRGrid.from_bits(pack_bits(blocked), row * cols + col, row * cols + cols - 1 - col, rows, cols)
+    grid.opponent = make_opponent(board['opponent'])
+    for t in range(max_steps):
+        _grid_observation(grid, obs[t])
+        valid = grid.valid_actions(grid.my_cell)
+        action = rng.choice(valid) if valid else 'up'
+        rewards[t] = grid.apply_move(action)
+        actions[t] = ACTION_INDEX[action]
+        if grid.game_over():
+            return t + 1
+    return max_steps
+
+
+def _play(index, seed, simulator, board, arrays):
+    # boards and the env's moves are drawn from the global numpy state, the
+    # simulator's moves from random
+    np.random.seed(seed)
+    random.seed(seed)
+    rng = random.Random(seed)
+    env = None
+    if simulator == 'env':
+        from gym_lightriders.envs.light_rider_env import LightRidersEnv
+        env = LightRidersEnv(**board)
+    obs = arrays['obs'][index]
+    actions = arrays['actions'][index]
+    rewards = arrays['rewards'][index]
+    lengths = arrays['lengths'][index]
+    max_steps = obs.shape[1]
+    for episode in range(obs.shape[0]):
+        if env is not None:
+            length = _env_episode(env, obs[episode], actions[episode], rewards[episode], max_steps)
+        else:
+            length = _grid_episode(rng, board, obs[episode], actions[episode], rewards[episode], max_steps)
+        lengths[episode] = length
+    return int(lengths.sum())
+
+
+def _worker(index, seed, simulator, board, names, layout):
+    handles, arrays = _attach(names, layout)
+    try:
+        return _play(index, seed, simulator, board, arrays)
+    finally:
+        # the views must be gone before the segments can be closed
+        arrays.clear()
+        for handle in handles.values():
+            handle.close()
+
+
+class RolloutRunner:
+    """Plays `workers * episodes_per_worker` random-valid episodes in a
+    process pool. Results stay in shared memory and are exposed as numpy
+    arrays indexed by (worker, episode, step); call `close` when done.
+
+    Boards are rows x cols with obstacles as in gym_lightriders.layouts,
+    the other rider is moved by a named Bot.opponents model.
+    """
+
+    def __init__(self, workers=None, episodes_per_worker=100, seed=0, simulator='env', max_steps=None, rows=ROWS,
+                 cols=COLS, layout='empty', density=DENSITY, opponent='random'):
+        if simulator not in ('env', 'grid'):
+            raise ValueError("simulator must be 'env' or 'grid'")
+        self.workers = workers or multiprocessing.cpu_count()
+        self.episodes_per_worker = episodes_per_worker
+        self.simulator = simulator
+        self.board = {'rows': rows, 'cols': cols, 'layout': layout, 'density': density, 'opponent': opponent}
+        if max_steps is None:
+            # both riders fill one cell per step, so no game outlasts half the board
+            max_steps = rows * cols // 2
+        self.seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(self.workers)]
+        self.layout = _buffer_layout(self.workers, episodes_per_worker, max_steps, rows, cols)
+        self._handles = {}
+        self.buffers = {}
+        for key, (shape, dtype) in self.layout.items():
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            self._handles[key] = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            self.buffers[key] = np.ndarray(shape, dtype=dtype, buffer=self._handles[key].buf)
+        self.stats = {}
+
+    def run(self):
+        names = {key: handle.name for key, handle in self._handles.items()}
+        jobs = [(i, self.seeds[i], self.simulator, self.board, names, self.layout) for i in range(self.workers)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(self.workers) as pool:
+            steps = pool.starmap(_worker, jobs)
+        seconds = time.perf_counter() - start
+        episodes = self.workers * self.episodes_per_worker
+        self.stats = {
+            'simulator': self.simulator,
+            'board': '%dx%d %s' % (self.board['rows'], self.board['cols'], self.board['layout']),
+            'workers': self.workers,
+            'episodes': episodes,
+            'steps': sum(steps),
+            'seconds': seconds,
+            'episodes_per_second': episodes / seconds,
+            'steps_per_second': sum(steps) / seconds,
+        }
+        return self.stats
+
+    def close(self):
+        self.buffers = {}
+        for handle in self._handles.values():
+            handle.close()
+            handle.unlink()
+        self._handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel LightRiders rollouts')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--episodes', type=int, default=100, help='episodes per worker')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--simulator', choices=('env', 'grid'), default='env')
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--cols', type=int, default=COLS)
+    parser.add_argument('--layout', choices=LAYOUTS, default='empty')
+    parser.add_argument('--density', type=float, default=DENSITY, help='obstacle density of the random layout')
+    parser.add_argument('--opponent', choices=sorted(OPPONENTS), default='random')
+    parser.add_argument('--scaling', action='store_true',
+                        help='repeat the run for 1, 2, 4, ... workers up to --workers')
+    args = parser.parse_args()
+
+    counts = [args.workers]
+    if args.scaling:
+        counts = sorted({min(2 ** i, args.workers) for i in range(args.workers.bit_length() + 1)})
+    for workers in counts:
+        with RolloutRunner(workers, args.episodes, args.seed, args.simulator, rows=args.rows, cols=args.cols,
+                           layout=args.layout, density=args.density, opponent=args.opponent) as runner:
+            print(json.dumps(runner.run()))
+
+
+if __name__ == '__main__':
+    main()